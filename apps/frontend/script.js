@@ -2,38 +2,30 @@ document.addEventListener('DOMContentLoaded', () => {
     const incidentIdInput = document.getElementById('incidentIdInput');
     const fetchButton = document.getElementById('fetchTimelineButton');
     const timelineContainer = document.getElementById('timeline-container');
-    let pollingInterval;
+    let eventSource;
 
     fetchButton.addEventListener('click', () => {
         const incidentId = incidentIdInput.value.trim();
         if (incidentId) {
-            // Clear previous timeline and stop old polling
-            if (pollingInterval) clearInterval(pollingInterval);
+            // Clear previous timeline and close the old stream
+            if (eventSource) eventSource.close();
             timelineContainer.innerHTML = '';
 
-            // Fetch immediately and then poll every 5 seconds
-            fetchAndRenderTimeline(incidentId);
-            pollingInterval = setInterval(() => fetchAndRenderTimeline(incidentId), 5000);
+            // The orchestrator sends the existing events first, then pushes new ones as they happen.
+            // On a dropped connection the browser reconnects and resumes from the last event ID.
+            eventSource = new EventSource(`http://localhost:8004/timeline/${incidentId}/stream`);
+            eventSource.onmessage = (message) => renderTimeline([JSON.parse(message.data)]);
+            eventSource.onerror = () => {
+                if (eventSource.readyState === EventSource.CLOSED) {
+                    console.error("Timeline stream closed.");
+                    timelineContainer.innerHTML = `<p class="error">Failed to load timeline. Is the orchestrator running?</p>`;
+                }
+            };
         }
     });
 
-    async function fetchAndRenderTimeline(incidentId) {
-        try {
-            const response = await fetch(`http://localhost:8004/timeline/${incidentId}`);
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            const events = await response.json();
-            renderTimeline(events);
-        } catch (error) {
-            console.error("Failed to fetch timeline:", error);
-            timelineContainer.innerHTML = `<p class="error">Failed to load timeline. Is the orchestrator running?</p>`;
-            if (pollingInterval) clearInterval(pollingInterval);
-        }
-    }
-
     function renderTimeline(events) {
-        timelineContainer.innerHTML = ''; // Clear existing content
+        // Events arrive incrementally, so append instead of re-rendering the whole list
         events.forEach(event => {
             const eventElement = document.createElement('div');
             eventElement.className = `timeline-event ${event.type}`;
@@ -46,12 +38,27 @@ document.addEventListener('DOMContentLoaded', () => {
             if (event.type === 'alert') {
                 title = `🚨 Alert Firing: ${event.payload.labels.alertname}`;
                 contentHtml = `<p>${event.payload.annotations.summary}</p><pre>${JSON.stringify(event.payload, null, 2)}</pre>`;
+            } else if (event.type === 'alert_still_firing') {
+                title = `🔁 Alert Still Firing`;
+                contentHtml = `<p>Alertmanager re-sent this alert; no new enrichment was run.</p>`;
+            } else if (event.type === 'alert_resolved') {
+                title = `✅ Alert Resolved`;
+                // Synthetic and predicted resolutions carry no endsAt (Alertmanager may send its zero time)
+                const endsAt = event.payload.endsAt ? new Date(event.payload.endsAt) : null;
+                const resolvedAt = endsAt && endsAt.getFullYear() > 1 ? endsAt.toLocaleString() : eventDate;
+                contentHtml = `<p><strong>Resolved at:</strong> ${resolvedAt}</p>`;
             } else if (event.type === 'ai_insight_docqa') {
                 title = `🤖 AI Insight: Document QA`;
                 contentHtml = `<p><strong>Suggestion:</strong> ${event.payload.answer}</p><p><strong>Source:</strong> <code>${event.payload.source}</code></p>`;
             } else if (event.type === 'ai_insight_vision') {
                 title = `👁️ AI Insight: OCR`;
                 contentHtml = `<p><strong>Extracted Text:</strong> ${event.payload.text}</p>`;
+                if (event.payload.artifact) {
+                    contentHtml += `<img class="panel-artifact" src="http://localhost:8004${event.payload.artifact.url}" alt="Grafana panel">`;
+                }
+            } else if (event.type === 'grafana_panel') {
+                title = `🖼️ Grafana Panel`;
+                contentHtml = `<img class="panel-artifact" src="http://localhost:8004${event.payload.artifact.url}" alt="Grafana panel">`;
             } else if (event.type === 'ai_insight_forecast') {
                 title = `📈 AI Insight: Time-Series Forecast`;
                 const forecastValues = event.payload.forecast[0].map(val => val.toFixed(3)).join(', ');
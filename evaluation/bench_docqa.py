@@ -0,0 +1,141 @@
+import argparse
+import importlib.util
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from bench_orchestrator import git_commit, summarize
+
+# Compares DocQA inference backends in-process on the eval_docqa.py golden
+# set. For each backend it loads the embedding and QA models the way the
+# service does, indexes the runbooks into a scratch directory, then measures
+# latency for single questions (an uncontended /ask) and for the whole set as
+# one micro-batch, plus accuracy. Needs services/docqa/requirements.txt.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_SET = os.path.join(ROOT, "evaluation", "docqa_golden.json")
+DEFAULT_BACKENDS = ["cpu-fp32", "cpu-int8", "cpu-onnx"]
+
+
+def load_service():
+    """Imports services/docqa/main.py without starting it."""
+    spec = importlib.util.spec_from_file_location("docqa_service", os.path.join(ROOT, "services", "docqa", "main.py"))
+    service = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(service)
+    return service
+
+
+def bench_backend(service, backend: str, golden: list, args) -> dict:
+    print(f"--- Benchmarking {backend} ---", file=sys.stderr)
+    # Each backend gets its own index, as int8 embeddings differ slightly from fp32 ones
+    service.INFERENCE_BACKEND = backend
+    service.INDEX_DIR = tempfile.mkdtemp(prefix=f"docqa-{backend}-")
+    service.runbooks_path = args.runbooks
+    service.vector_store, service.lexical_index, service.manifest = None, None, {}
+
+    started = time.perf_counter()
+    service.embeddings = service.load_embeddings(backend)
+    service.qa_pipeline = service.load_qa_pipeline(backend)
+    load_s = time.perf_counter() - started
+    started = time.perf_counter()
+    index_summary = service.reindex()
+    index_s = time.perf_counter() - started
+
+    questions = [(pair["question"], args.top_k) for pair in golden]
+    service.answer_batch(service.vector_store, service.lexical_index, questions[:1])  # warm-up
+
+    single_ms, batch_ms, answers = [], [], []
+    for _ in range(args.repeat):
+        for question in questions:
+            started = time.perf_counter()
+            answers.append(service.answer_batch(service.vector_store, service.lexical_index, [question])[0])
+            single_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        service.answer_batch(service.vector_store, service.lexical_index, questions)
+        batch_ms.append((time.perf_counter() - started) * 1000)
+
+    last_round = answers[-len(golden):]
+    correct = [
+        bool(answer) and pair["expected_answer_fragment"].lower() in answer["answer"].lower()
+        for pair, answer in zip(golden, last_round)
+    ]
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "index_s": round(index_s, 2),
+        "chunks": index_summary.get("chunks"),
+        "question_ms": summarize(single_ms),
+        "batch_ms": summarize(batch_ms),
+        "accuracy": round(sum(correct) / len(golden), 3),
+        "paths": dict(Counter(answer["path"] for answer in last_round if answer)),
+        "answers": [
+            {"question": pair["question"], "answer": answer and answer["answer"], "score": answer and round(answer["score"], 4), "correct": ok}
+            for pair, answer, ok in zip(golden, last_round, correct)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and accuracy of DocQA inference backends on the golden set.")
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS, help="cuda-fp32, cpu-fp32, cpu-int8 and/or cpu-onnx; the first is the baseline")
+    parser.add_argument("--runbooks", default=os.path.join(ROOT, "data", "runbooks"))
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=10, help="passes over the golden set per backend")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads on CPU (default: one per core)")
+    parser.add_argument("--with-lexical", action="store_true", help="let the lexical fast path answer; by default every question goes through the models")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with open(GOLDEN_SET) as f:
+        golden = json.load(f)
+    service = load_service()
+    service.NUM_THREADS = args.threads
+    if not args.with_lexical:
+        service.LEXICAL_MIN_MATCH = math.inf
+
+    results = [bench_backend(service, backend, golden, args) for backend in args.backends]
+    baseline = results[0]
+    for result in results:
+        result["vs_baseline"] = {
+            "question_p50_speedup": round(baseline["question_ms"]["p50"] / result["question_ms"]["p50"], 2),
+            "batch_p50_speedup": round(baseline["batch_ms"]["p50"] / result["batch_ms"]["p50"], 2),
+            "accuracy_delta": round(result["accuracy"] - baseline["accuracy"], 3),
+        }
+
+    report = {
+        "benchmark": "docqa_backends",
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "golden_set": os.path.relpath(GOLDEN_SET, ROOT),
+            "questions": len(golden),
+            "top_k": args.top_k,
+            "repeat": args.repeat,
+            "threads": service.cpu_threads(),
+            "lexical_fast_path": args.with_lexical,
+        },
+        "backends": results,
+    }
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered + "\n")
+        print(f"--- Report written to {args.output} ---", file=sys.stderr)
+    else:
+        print(rendered)
+
+    for result in results:
+        print(
+            f"--- {result['backend']}: question p50 {result['question_ms']['p50']}ms, batch p50 {result['batch_ms']['p50']}ms, "
+            f"accuracy {result['accuracy']:.0%} ({result['vs_baseline']['question_p50_speedup']}x vs {baseline['backend']}) ---",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
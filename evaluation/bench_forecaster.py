@@ -0,0 +1,186 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from bench_orchestrator import git_commit, summarize
+
+# Compares the forecaster's tiers on recorded latency histories. The history
+# is cut into sliding windows; each window's context is forecast once per tier
+# (statistical screen, Chronos, and auto, which screens and escalates) and the
+# forecast is scored against the points that actually followed: mean absolute
+# error, and whether it called an SLO breach over the horizon correctly.
+# Tier passes bypass the forecaster's cache; a separate pass repeats each
+# Chronos forecast to measure cached latency, and the report includes the
+# service's cold start (model load and warmup) and cache hit rate.
+# Histories come from Prometheus (--prometheus, optionally saved with --record)
+# or from a file written earlier with --record, so runs can be repeated.
+
+QUERY = "toyprod:p95_latency_seconds:5m"
+LATENCY_SLO = 0.300  # same SLO the orchestrator warns on
+TIERS = ["statistical", "chronos", "auto"]
+NO_CACHE = {"Cache-Control": "no-cache"}
+
+
+def fetch_histories(prometheus: str, hours: float, step: int) -> list:
+    end = int(time.time())
+    params = {"query": QUERY, "start": end - int(hours * 3600), "end": end, "step": f"{step}s"}
+    response = httpx.get(f"{prometheus}/api/v1/query_range", params=params, timeout=60.0)
+    response.raise_for_status()
+    return [
+        {"labels": result["metric"], "values": [float(value) for _, value in result["values"]]}
+        for result in response.json()["data"]["result"]
+    ]
+
+
+def load_histories(path: str) -> list:
+    """Reads a --record file, or a raw Prometheus query_range response."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "data" in data:
+        return [
+            {"labels": result["metric"], "values": [float(value) for _, value in result["values"]]}
+            for result in data["data"]["result"]
+        ]
+    return data
+
+
+def windows(histories: list, context: int, horizon: int, stride: int) -> list:
+    cut = []
+    for history in histories:
+        values = history["values"]
+        for start in range(0, len(values) - context - horizon + 1, stride):
+            cut.append((values[start:start + context], values[start + context:start + context + horizon]))
+    return cut
+
+
+def bench_tier(client: httpx.Client, args, tier: str, cases: list) -> dict:
+    print(f"--- Benchmarking {tier} tier on {len(cases)} windows ---", file=sys.stderr)
+    latencies, errors, answered_by = [], [], {}
+    hits = {"true_positive": 0, "false_positive": 0, "false_negative": 0, "true_negative": 0}
+    for context, actual in cases:
+        payload = {"history": context, "prediction_length": len(actual), "threshold": args.slo, "tier": tier}
+        started = time.perf_counter()
+        response = client.post(args.url, json=payload, headers=NO_CACHE)
+        latencies.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        result = response.json()
+        forecast = result["forecast"][0]
+        answered_by[result["tier"]] = answered_by.get(result["tier"], 0) + 1
+        errors.append(sum(abs(f - a) for f, a in zip(forecast, actual)) / len(actual))
+
+        predicted, breached = max(forecast) > args.slo, max(actual) > args.slo
+        key = ("true_" if predicted == breached else "false_") + ("positive" if predicted else "negative")
+        hits[key] += 1
+
+    caught = hits["true_positive"] + hits["false_negative"]
+    return {
+        "tier": tier,
+        "latency_ms": summarize(latencies),
+        "mae": round(sum(errors) / len(errors), 5),
+        "breach_recall": round(hits["true_positive"] / caught, 3) if caught else None,
+        "breach_calls": hits,
+        "answered_by": answered_by,
+    }
+
+
+def bench_cache(client: httpx.Client, args, cases: list) -> dict:
+    """Forecasts each window with Chronos twice: once fresh, then (within the TTL) from the cache."""
+    print(f"--- Benchmarking the forecast cache on {len(cases)} windows ---", file=sys.stderr)
+    fresh_ms, cached_ms, hits = [], [], 0
+    for context, actual in cases:
+        payload = {"history": context, "prediction_length": len(actual), "tier": "chronos"}
+        for headers, latencies in ((NO_CACHE, fresh_ms), ({}, cached_ms)):
+            started = time.perf_counter()
+            response = client.post(args.url, json=payload, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+        hits += response.json()["cached"]
+    return {
+        "fresh_ms": summarize(fresh_ms),
+        "cached_ms": summarize(cached_ms),
+        "repeat_hit_rate": round(hits / len(cases), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Accuracy and latency of each forecaster tier on recorded {QUERY} histories.")
+    parser.add_argument("--url", default="http://localhost:8005/forecast", help="forecaster /forecast endpoint")
+    parser.add_argument("--histories", help="histories saved with --record (or a query_range response)")
+    parser.add_argument("--prometheus", default="http://localhost:9090", help="fetch histories from here when --histories is not given")
+    parser.add_argument("--hours", type=float, default=24, help="how much history to fetch")
+    parser.add_argument("--step", type=int, default=60, help="seconds between points, as the orchestrator queries them")
+    parser.add_argument("--record", help="save the fetched histories here for later runs")
+    parser.add_argument("--context", type=int, default=60, help="points of history per forecast (the orchestrator sends one hour)")
+    parser.add_argument("--horizon", type=int, default=12)
+    parser.add_argument("--stride", type=int, default=12, help="points between window starts")
+    parser.add_argument("--slo", type=float, default=LATENCY_SLO)
+    parser.add_argument("--tiers", nargs="+", default=TIERS, choices=TIERS)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.histories:
+        histories = load_histories(args.histories)
+    else:
+        histories = fetch_histories(args.prometheus, args.hours, args.step)
+        if args.record:
+            with open(args.record, "w", encoding="utf-8") as f:
+                json.dump(histories, f)
+            print(f"--- Recorded {len(histories)} histories to {args.record} ---", file=sys.stderr)
+    cases = windows(histories, args.context, args.horizon, args.stride)
+    if not cases:
+        sys.exit(f"No {args.context}+{args.horizon} point windows in {len(histories)} histories")
+
+    with httpx.Client(timeout=120.0) as client:
+        # One untimed call per tier so model warm-up is not counted
+        for tier in args.tiers:
+            client.post(args.url, json={"history": cases[0][0], "prediction_length": args.horizon, "tier": tier}).raise_for_status()
+        results = [bench_tier(client, args, tier, cases) for tier in args.tiers]
+        cache = bench_cache(client, args, cases)
+        # Device, cold start and lifetime cache counters as the service reports them
+        service = client.get(args.url.rsplit("/forecast", 1)[0] + "/healthz").json()
+
+    report = {
+        "benchmark": "forecaster_tiers",
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "query": QUERY,
+            "histories": len(histories),
+            "windows": len(cases),
+            "context": args.context,
+            "horizon": args.horizon,
+            "stride": args.stride,
+            "slo": args.slo,
+            "windows_breaching": sum(max(actual) > args.slo for _, actual in cases),
+        },
+        "service": service,
+        "tiers": results,
+        "cache": cache,
+    }
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered + "\n")
+        print(f"--- Report written to {args.output} ---", file=sys.stderr)
+    else:
+        print(rendered)
+
+    for result in results:
+        print(
+            f"--- {result['tier']}: p50 {result['latency_ms']['p50']}ms, MAE {result['mae']}, "
+            f"breach recall {result['breach_recall']}, answered by {result['answered_by']} ---",
+            file=sys.stderr,
+        )
+    print(
+        f"--- cache: fresh p50 {cache['fresh_ms']['p50']}ms, cached p50 {cache['cached_ms']['p50']}ms, "
+        f"service hit rate {service['cache']['hit_rate']}, cold start {service['cold_start']} on {service['device']} ---",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import copy
+import json
+import math
+import random
+import re
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+import httpx
+
+# Replays Alertmanager webhook payloads against the orchestrator at a fixed,
+# open-loop rate and follows every resulting incident over its SSE timeline
+# stream until each expected enrichment stage has landed. Run it with
+# evaluation/stub_gateway.py standing in for the AI services to benchmark the
+# pipeline itself without GPUs.
+
+# Enrichment stages the orchestrator runs per alert name (see process_alert)
+EXPECTED_STAGES = {"ToyProdHighLatency": {"docqa", "vision", "forecast"}}
+DEFAULT_STAGES = {"docqa"}
+EVENT_STAGES = {"ai_insight_docqa": "docqa", "ai_insight_vision": "vision", "ai_insight_forecast": "forecast"}
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{stage="(\w+)"\})?\s+([0-9.eE+-]+)$')
+
+
+# --- Payloads ---
+def synthetic_payload(alert_name: str) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "receiver": "alertlogger",
+        "status": "firing",
+        "alerts": [{
+            "status": "firing",
+            "labels": {"alertname": alert_name, "severity": "ticket"},
+            "annotations": {"summary": f"Benchmark alert {alert_name}", "description": "Synthetic alert from bench_orchestrator.py"},
+            "startsAt": now,
+        }],
+        "groupLabels": {"alertname": alert_name},
+        "commonLabels": {"alertname": alert_name},
+        "version": "4",
+    }
+
+
+def load_payloads(path: str) -> list:
+    """
+    Reads captured webhook payloads: either `docker compose logs alertlogger`
+    output (lines containing 'ALERTLOGGER {...}') or one JSON payload per line.
+    """
+    payloads = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if "ALERTLOGGER " in line:
+                payloads.append(json.loads(line.split("ALERTLOGGER ", 1)[1])["payload"])
+            elif line.strip().startswith("{"):
+                payloads.append(json.loads(line))
+    return [payload for payload in payloads if payload.get("alerts")]
+
+
+def fresh_copy(payload: dict) -> dict:
+    # Every replayed alert must open its own incident, so give it a new fingerprint
+    # and replay it as firing; otherwise the orchestrator folds it into an open one.
+    payload = copy.deepcopy(payload)
+    for alert in payload["alerts"]:
+        alert["status"] = "firing"
+        alert["fingerprint"] = uuid.uuid4().hex[:16]
+    return payload
+
+
+# --- Measurement ---
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[index], 2)
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+async def scrape_metrics(client: httpx.AsyncClient, orchestrator: str) -> dict:
+    """Returns {(metric, stage): value} for the orchestrator's own counters and histograms."""
+    try:
+        response = await client.get(f"{orchestrator}/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"--- WARNING: could not scrape {orchestrator}/metrics: {e} ---", file=sys.stderr)
+        return {}
+    samples = {}
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match and match.group(1).startswith("orchestrator_"):
+            samples[(match.group(1), match.group(2))] = float(match.group(3))
+    return samples
+
+
+def metrics_delta(before: dict, after: dict) -> dict:
+    delta = lambda key: after.get(key, 0.0) - before.get(key, 0.0)
+    stages = sorted({stage for (name, stage) in after if name == "orchestrator_stage_duration_seconds_count"})
+    per_stage = {}
+    for stage in stages:
+        count = delta(("orchestrator_stage_duration_seconds_count", stage))
+        if count:
+            total = delta(("orchestrator_stage_duration_seconds_sum", stage))
+            per_stage[stage] = {"calls": int(count), "mean_ms": round(total / count * 1000, 2)}
+    flushes = delta(("orchestrator_stage_duration_seconds_count", "db_insert"))
+    events = delta(("orchestrator_timeline_events_written_total", None))
+    return {
+        "stages": per_stage,
+        "db_writes": {
+            "transactions": int(flushes),
+            "events": int(events),
+            "events_per_transaction": round(events / flushes, 2) if flushes else None,
+        },
+        "failures": {stage: int(delta(("orchestrator_failures_total", stage))) for stage in stages if delta(("orchestrator_failures_total", stage))},
+    }
+
+
+async def follow_incident(client: httpx.AsyncClient, orchestrator: str, incident_id: str, expected: set, sent_at: float, timeout: float) -> dict:
+    """Follows the incident's SSE stream until every expected stage reported (or timed out / errored)."""
+    result = {"incident_id": incident_id, "complete": False, "stages_ms": {}, "stage_durations_ms": {}}
+    pending = set(expected)
+
+    async def read_stream():
+        async with client.stream("GET", f"{orchestrator}/timeline/{incident_id}/stream", timeout=None) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                payload = event.get("payload") or {}
+                stage = EVENT_STAGES.get(event["type"]) or (payload.get("stage") if event["type"] in ("stage_timeout", "stage_error") else None)
+                if stage is None or stage not in pending:
+                    continue
+                pending.discard(stage)
+                result["stages_ms"][stage] = round((time.perf_counter() - sent_at) * 1000, 2)
+                if "duration_ms" in payload:
+                    result["stage_durations_ms"][stage] = payload["duration_ms"]
+                if event["type"] in ("stage_timeout", "stage_error"):
+                    result.setdefault("stage_failures", []).append(stage)
+                if not pending:
+                    return
+
+    try:
+        await asyncio.wait_for(read_stream(), timeout=timeout)
+        result["complete"] = True
+        result["end_to_end_ms"] = max(result["stages_ms"].values()) if result["stages_ms"] else 0.0
+    except (asyncio.TimeoutError, httpx.HTTPError) as e:
+        result["error"] = type(e).__name__
+    return result
+
+
+async def send_one(client: httpx.AsyncClient, args, payload: dict) -> dict:
+    sent_at = time.perf_counter()
+    try:
+        response = await client.post(f"{args.orchestrator}/webhook/alert", json=payload)
+    except httpx.HTTPError as e:
+        return {"ack_ms": None, "error": type(e).__name__, "incidents": []}
+    ack_ms = round((time.perf_counter() - sent_at) * 1000, 2)
+    if response.status_code >= 300:
+        return {"ack_ms": ack_ms, "error": f"HTTP {response.status_code}", "incidents": []}
+
+    incident_ids = response.json().get("incident_ids", [])
+    if args.ack_only:
+        return {"ack_ms": ack_ms, "incidents": []}
+    followers = []
+    for incident_id, alert in zip(incident_ids, payload["alerts"]):
+        expected = EXPECTED_STAGES.get(alert.get("labels", {}).get("alertname"), DEFAULT_STAGES)
+        followers.append(follow_incident(client, args.orchestrator, incident_id, expected, sent_at, args.incident_timeout))
+    return {"ack_ms": ack_ms, "incidents": await asyncio.gather(*followers)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    if args.payloads:
+        templates = load_payloads(args.payloads)
+        if not templates:
+            sys.exit(f"No webhook payloads found in {args.payloads}")
+    else:
+        templates = [synthetic_payload(name) for name in args.alertnames]
+
+    total = int(args.rate * args.duration)
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+        before = await scrape_metrics(client, args.orchestrator)
+        started = time.perf_counter()
+
+        # Open loop: send times are fixed up front and never wait for earlier requests to finish.
+        tasks, next_send = [], started
+        for i in range(total):
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = fresh_copy(templates[i % len(templates)] if not args.shuffle else rng.choice(templates))
+            tasks.append(asyncio.create_task(send_one(client, args, payload)))
+            next_send += rng.expovariate(args.rate) if args.arrivals == "poisson" else 1.0 / args.rate
+        send_window = time.perf_counter() - started
+
+        results = await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+        # Let the last group commit land before reading the counters.
+        await asyncio.sleep(1.0)
+        after = await scrape_metrics(client, args.orchestrator)
+
+    incidents = [incident for result in results for incident in result["incidents"]]
+    completed = [incident for incident in incidents if incident["complete"]]
+    stage_names = sorted({stage for incident in completed for stage in incident["stages_ms"]})
+    return {
+        "benchmark": "orchestrator",
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "orchestrator": args.orchestrator,
+            "rate": args.rate,
+            "duration_s": args.duration,
+            "arrivals": args.arrivals,
+            "payloads": args.payloads or "synthetic",
+            "alertnames": None if args.payloads else args.alertnames,
+        },
+        "webhooks": {
+            "sent": total,
+            "errors": sum(1 for result in results if result.get("error")),
+            "offered_rate": round(total / send_window, 2) if send_window else None,
+            "ack_ms": summarize([result["ack_ms"] for result in results if result["ack_ms"] is not None]),
+        },
+        "incidents": {
+            "tracked": len(incidents),
+            "completed": len(completed),
+            "incomplete": len(incidents) - len(completed),
+            "throughput_per_s": round(len(completed) / wall, 2) if wall else None,
+            "end_to_end_ms": summarize([incident["end_to_end_ms"] for incident in completed]),
+        },
+        "stages": {
+            stage: {
+                "arrival_ms": summarize([i["stages_ms"][stage] for i in completed if stage in i["stages_ms"]]),
+                "duration_ms": summarize([i["stage_durations_ms"][stage] for i in completed if stage in i["stage_durations_ms"]]),
+            }
+            for stage in stage_names
+        },
+        "orchestrator": metrics_delta(before, after) if before and after else None,
+        "wall_time_s": round(wall, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop replay benchmark for the orchestrator's alert pipeline.")
+    parser.add_argument("--orchestrator", default="http://localhost:8004", help="orchestrator base URL")
+    parser.add_argument("--rate", type=float, default=2.0, help="webhook deliveries per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep sending")
+    parser.add_argument("--arrivals", choices=["uniform", "poisson"], default="uniform")
+    parser.add_argument("--payloads", help="alertlogger log or JSON-lines file of captured webhook payloads (default: synthetic)")
+    parser.add_argument("--alertnames", nargs="+", default=["ToyProdHighLatency", "ToyProdHighErrorRate"], help="alert names for synthetic payloads")
+    parser.add_argument("--shuffle", action="store_true", help="pick payload templates at random instead of round-robin")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ack-only", action="store_true", help="only measure webhook acknowledgement, do not follow incidents")
+    parser.add_argument("--incident-timeout", type=float, default=180.0, help="seconds to wait for an incident's timeline to complete")
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered + "\n")
+        print(f"--- Report written to {args.output} ---", file=sys.stderr)
+    else:
+        print(rendered)
+
+    e2e = report["incidents"]["end_to_end_ms"]
+    print(
+        f"--- {report['incidents']['completed']}/{report['incidents']['tracked']} incidents complete, "
+        f"{report['incidents']['throughput_per_s']}/s, end-to-end p50 {e2e['p50']}ms p95 {e2e['p95']}ms p99 {e2e['p99']}ms ---",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
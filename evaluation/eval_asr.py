@@ -23,7 +23,7 @@ print(f"\n--- Sending {audio_filename} to ASR service at {gateway_url} ---")
 hypothesis_text = ""
 try:
     with open(audio_filename, 'rb') as f:
-        response = requests.post(gateway_url, files={"audio_file": (audio_filename, f, "audio/mpeg")})
+        response = requests.post(gateway_url, files={"audio_file": (audio_filename, f, "audio/mpeg")}, headers={"X-Priority": "batch"})
 
     if response.status_code == 200:
         hypothesis_text = response.json().get("text", "").strip()
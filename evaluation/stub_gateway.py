@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import random
+import re
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+# A stand-in for everything the orchestrator talks to during an incident, so the
+# pipeline can be benchmarked without GPUs: the AI gateway routes, Grafana's
+# renderer, Prometheus query_range, and the Slack / GitHub notification APIs.
+# Point the orchestrator at it with AI_GATEWAY_URL, GRAFANA_URL, PROMETHEUS_URL,
+# SLACK_WEBHOOK_URL (<stub>/slack) and GITHUB_API_URL.
+
+app = FastAPI(title="Stub AI Gateway")
+
+# Simulated latencies in milliseconds, overridable from the command line
+LATENCY_MS = {
+    "docqa": 300,
+    "vision": 500,
+    "forecaster": 400,
+    "render": 800,
+    "prometheus": 20,
+    "notify": 50,
+}
+JITTER = 0.2
+# Services reported for every svc:* metric in query_range, to scale the forecast scan
+SERVICES = 3
+CALLS = {name: 0 for name in LATENCY_MS}
+
+# A tiny valid PNG, returned as the "rendered" Grafana panel
+PANEL_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+
+async def simulate(name: str):
+    CALLS[name] += 1
+    delay = LATENCY_MS[name] * random.uniform(1 - JITTER, 1 + JITTER)
+    await asyncio.sleep(delay / 1000.0)
+
+
+@app.post("/route/docqa")
+async def docqa(request: Request):
+    body = await request.json()
+    await simulate("docqa")
+    return {"answer": "Roll back to the last known good version.", "score": 0.87, "source": "/data/runbooks/stub.md", "query": body.get("query")}
+
+
+@app.post("/route/vision")
+async def vision(request: Request):
+    await request.body()
+    await simulate("vision")
+    return {"text": "p95 latency 412 ms"}
+
+
+@app.post("/route/forecaster")
+async def forecaster(request: Request):
+    body = await request.json()
+    await simulate("forecaster")
+    last = (body.get("history") or [0.25])[-1]
+    prediction_length = body.get("prediction_length", 12)
+    return {"forecast": [[round(last * (1 + 0.02 * i), 4) for i in range(1, prediction_length + 1)]]}
+
+
+@app.post("/route/forecaster_batch")
+async def forecaster_batch(request: Request):
+    body = await request.json()
+    await simulate("forecaster")
+    prediction_length = body.get("prediction_length", 12)
+    forecasts = []
+    for series in body.get("series", []):
+        last = series["history"][-1]
+        mean = [round(last * (1 + 0.02 * i), 4) for i in range(1, prediction_length + 1)]
+        forecasts.append({"name": series["name"], "mean": mean, "quantiles": {"0.5": mean}, "tier": "statistical", "reason": "clear"})
+    return {"forecasts": forecasts, "stats": {"series": len(forecasts)}}
+
+
+@app.get("/render/d-solo/{dashboard_uid}/")
+async def render(dashboard_uid: str):
+    await simulate("render")
+    return Response(content=PANEL_PNG, media_type="image/png")
+
+
+@app.get("/api/v1/query_range")
+async def query_range(start: float, end: float, step: str = "60s", query: str = ""):
+    await simulate("prometheus")
+    step_s = int(step.rstrip("s"))
+    timestamps = range(int(start), int(end) + 1, step_s)
+    # A {__name__=~"a|b"} selector (the forecast scan) gets every series of each metric
+    names = re.fullmatch(r'\{__name__=~"(.*)"\}', query)
+    if not names:
+        values = [[ts, f"{0.25 + 0.05 * random.random():.4f}"] for ts in timestamps]
+        return {"status": "success", "data": {"resultType": "matrix", "result": [{"metric": {}, "values": values}]}}
+    result = []
+    for name in names.group(1).replace("\\", "").split("|"):
+        for labels in ([{"svc": f"svc-{i}"} for i in range(SERVICES)] if name.startswith("svc:") else [{}]):
+            values = [[ts, f"{0.25 + 0.05 * random.random():.4f}"] for ts in timestamps]
+            result.append({"metric": {"__name__": name, **labels}, "values": values})
+    return {"status": "success", "data": {"resultType": "matrix", "result": result}}
+
+
+@app.post("/slack")
+async def slack(request: Request):
+    await request.body()
+    await simulate("notify")
+    return Response(content="ok")
+
+
+@app.post("/repos/{owner}/{repo}/issues")
+async def github_issue(owner: str, repo: str, request: Request):
+    await request.body()
+    await simulate("notify")
+    return {"number": CALLS["notify"]}
+
+
+@app.get("/stats")
+def stats():
+    return {"calls": CALLS, "latency_ms": LATENCY_MS, "jitter": JITTER}
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+def main():
+    global JITTER, SERVICES
+    parser = argparse.ArgumentParser(description="GPU-free stand-in for the AI gateway and the orchestrator's other dependencies.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9999)
+    for name, default in LATENCY_MS.items():
+        parser.add_argument(f"--{name}-ms", type=float, default=default, help=f"simulated {name} latency (default {default}ms)")
+    parser.add_argument("--jitter", type=float, default=JITTER, help="relative +/- jitter applied to every latency")
+    parser.add_argument("--services", type=int, default=SERVICES, help="services reported for each svc:* metric in query_range")
+    args = parser.parse_args()
+
+    for name in LATENCY_MS:
+        LATENCY_MS[name] = getattr(args, f"{name}_ms")
+    JITTER = args.jitter
+    SERVICES = args.services
+    print(f"--- Stub gateway on :{args.port} with latencies {LATENCY_MS} (jitter {JITTER}) ---")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
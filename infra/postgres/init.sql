@@ -4,4 +4,46 @@ CREATE TABLE timeline (
     event_ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     type VARCHAR(50) NOT NULL,
     payload JSONB
-);
\ No newline at end of file
+);
+
+-- Serves /timeline/{incident_id} reads (filter by incident, ordered by time) without a sequential scan.
+CREATE INDEX timeline_incident_id_event_ts_idx ON timeline (incident_id, event_ts, id);
+
+-- Announces every new timeline row on one channel; the orchestrator fans it out to live viewers.
+CREATE FUNCTION notify_timeline_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('timeline_events', json_build_object('incident_id', NEW.incident_id, 'id', NEW.id)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER timeline_event_notify
+    AFTER INSERT ON timeline
+    FOR EACH ROW EXECUTE FUNCTION notify_timeline_event();
+
+CREATE TABLE alert_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    incident_id VARCHAR(255) NOT NULL,
+    kind VARCHAR(20) NOT NULL DEFAULT 'new',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    alert JSONB NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX alert_jobs_status_id_idx ON alert_jobs (status, id);
+
+CREATE TABLE incidents (
+    incident_id VARCHAR(255) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    alertname VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    opened_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    resolved_at TIMESTAMPTZ
+);
+
+-- At most one open incident per alert fingerprint.
+CREATE UNIQUE INDEX incidents_open_fingerprint_idx ON incidents (fingerprint) WHERE status = 'open';
@@ -1,5 +1,18 @@
+import os
+import time
+import json
+import base64
+import asyncio
+import heapq
+import random
+import hashlib
+import itertools
 import httpx
+from collections import OrderedDict
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
 
 app = FastAPI(title="AI Gateway")
 
@@ -10,41 +23,711 @@ SERVICE_URLS = {
     "docqa": "http://docqa:8000/ask",
     "forecaster": "http://forecaster:8000/forecast",
 }
+# Extra routes served by another service's replicas, admission queue and breakers, at a different path
+ROUTE_ALIASES = {
+    "forecaster_batch": ("forecaster", "/forecast/batch"),
+}
+
+# --- Replica Pools ---
+# Each service can run several replicas, listed as e.g.
+# DOCQA_REPLICAS="http://docqa-1:8000/ask,http://docqa-2:8000/ask"; by default the single URL above.
+SERVICE_REPLICAS = {
+    name: [replica.strip() for replica in os.getenv(f"{name.upper()}_REPLICAS", url).split(",") if replica.strip()]
+    for name, url in SERVICE_URLS.items()
+}
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Consecutive failures (transport errors or 5xx) that open a replica's breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# --- Connection Pools ---
+# One long-lived client per backend, so calls reuse keep-alive connections
+# instead of paying for a new TCP connection every time.
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "60"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+
+# Headers that only describe a single hop and must not be forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "proxy-connection", "te", "trailer", "transfer-encoding", "upgrade",
+}
+
+# --- Admission Control ---
+# At most <SERVICE>_MAX_CONCURRENCY requests reach a service at once; up to
+# <SERVICE>_MAX_QUEUE more wait in priority order, and the rest are shed.
+MAX_CONCURRENCY = {
+    name: int(os.getenv(f"{name.upper()}_MAX_CONCURRENCY", os.getenv("GATEWAY_MAX_CONCURRENCY", "8")))
+    for name in SERVICE_URLS
+}
+MAX_QUEUE = {
+    name: int(os.getenv(f"{name.upper()}_MAX_QUEUE", os.getenv("GATEWAY_MAX_QUEUE", "32")))
+    for name in SERVICE_URLS
+}
+QUEUE_TIMEOUT = float(os.getenv("GATEWAY_QUEUE_TIMEOUT", "30"))
+# Lower runs first. Callers send X-Priority, or X-Caller which is mapped through GATEWAY_CALLER_PRIORITIES.
+PRIORITY_CLASSES = {"incident": 0, "interactive": 1, "batch": 2}
+CALLER_PRIORITIES = dict(
+    item.strip().split("=")
+    for item in os.getenv("GATEWAY_CALLER_PRIORITIES", "orchestrator=incident,slackbot=interactive,evaluation=batch").split(",")
+    if item.strip()
+)
+DEFAULT_PRIORITY = os.getenv("GATEWAY_DEFAULT_PRIORITY", "interactive")
+
+# --- Batch Fan-out ---
+GATEWAY_MAX_BATCH = int(os.getenv("GATEWAY_MAX_BATCH", "32"))
+
+# --- Response Cache ---
+# Opt-in per route as "service=ttl_seconds,..." (e.g. "docqa=300,forecaster=60"); off by default.
+# Only idempotent JSON routes belong here. A backend whose /healthz reports an
+# "answers_version" (DocQA does) has its entries dropped whenever that changes.
+CACHE_TTLS = {
+    name.strip(): float(ttl)
+    for name, ttl in (item.split("=") for item in os.getenv("GATEWAY_CACHE_ROUTES", "").split(",") if item.strip())
+}
+CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# --- Metrics ---
+CACHE_REQUESTS = Counter("gateway_cache_requests_total", "Cacheable requests (by result: hit, miss, coalesced, bypass)", ["service", "result"])
+CACHE_ENTRIES = Gauge("gateway_cache_entries", "Responses held in the gateway cache")
+CACHE_BYTES = Gauge("gateway_cache_bytes", "Response bytes held in the gateway cache")
+REPLICA_OUTSTANDING = Gauge("gateway_replica_outstanding_requests", "Requests in flight to a backend replica", ["service", "replica"])
+REPLICA_UP = Gauge("gateway_replica_up", "1 if a backend replica passes health checks and its breaker is closed", ["service", "replica"])
+BREAKER_TRIPS = Counter("gateway_breaker_trips_total", "Times a replica's circuit breaker opened", ["service", "replica"])
+QUEUE_DEPTH = Gauge("gateway_admission_queue_depth", "Requests waiting for a backend slot", ["service"])
+ADMITTED_IN_FLIGHT = Gauge("gateway_admission_in_flight", "Requests holding a backend slot", ["service"])
+QUEUE_WAIT = Histogram(
+    "gateway_admission_wait_seconds", "Time spent waiting for a backend slot", ["service", "priority"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SHED = Counter("gateway_admission_shed_total", "Requests rejected by admission control (by reason: queue_full, displaced, timeout)", ["service", "priority", "reason"])
+NO_REPLICA = Counter("gateway_no_replica_total", "Requests rejected because no replica was available", ["service"])
+
+backend_clients = {}
+
+class ResponseCache:
+    """
+    LRU cache of successful backend responses, bounded by entry count and
+    total body size, with a per-route TTL.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, entry: dict, ttl: float):
+        if len(entry["body"]) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = {**entry, "expires_at": time.monotonic() + ttl}
+        self._bytes += len(entry["body"])
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        self._update_gauges()
+
+    def invalidate(self, service_name: str = None) -> int:
+        # A service's entries include those cached under its route aliases
+        keys = [key for key in self._entries if service_name is None or service_name in (key[0], resolve_route(key[0])[0])]
+        for key in keys:
+            self._remove(key)
+        self._update_gauges()
+        return len(keys)
+
+    def _remove(self, key: tuple):
+        self._bytes -= len(self._entries.pop(key)["body"])
+
+    def _update_gauges(self):
+        CACHE_ENTRIES.set(len(self._entries))
+        CACHE_BYTES.set(self._bytes)
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+# Cache key -> task for the one backend call that identical concurrent requests share
+inflight_requests = {}
+# Service -> the last answers_version its replicas reported
+answers_versions = {}
+
+class Overloaded(Exception):
+    """A request was shed by admission control; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+class AdmissionQueue:
+    """
+    Concurrency limit for one service with a bounded priority queue behind it.
+    A freed slot is handed straight to the best waiter (lowest priority class,
+    then arrival order). When the queue is full a newcomer displaces the worst
+    waiter if it outranks it, and is turned away otherwise.
+    """
+
+    def __init__(self, service_name: str, max_concurrency: int, max_queue: int):
+        self.service_name = service_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority: str):
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            self._update_gauges()
+            QUEUE_WAIT.labels(service=self.service_name, priority=priority).observe(0)
+            return
+
+        rank = PRIORITY_CLASSES[priority]
+        if len(self._waiting) >= self.max_queue:
+            worst = max(self._waiting, key=lambda entry: (entry[0], entry[1])) if self._waiting else None
+            if worst is None or worst[0] <= rank:
+                SHED.labels(service=self.service_name, priority=priority, reason="queue_full").inc()
+                raise Overloaded(429, f"'{self.service_name}' queue is full")
+            self._remove(worst)
+            worst[2].set_exception(Overloaded(503, f"displaced from the '{self.service_name}' queue by higher-priority work"))
+
+        entry = (rank, next(self._arrivals), asyncio.get_running_loop().create_future(), priority)
+        heapq.heappush(self._waiting, entry)
+        self._update_gauges()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(entry[2], QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            SHED.labels(service=self.service_name, priority=priority, reason="timeout").inc()
+            raise Overloaded(503, f"timed out after {QUEUE_TIMEOUT:.0f}s waiting for a '{self.service_name}' slot")
+        except Overloaded:
+            SHED.labels(service=self.service_name, priority=priority, reason="displaced").inc()
+            raise
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller went away
+            if entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+                self.release()
+            else:
+                self._remove(entry)
+            raise
+        QUEUE_WAIT.labels(service=self.service_name, priority=priority).observe(time.monotonic() - started)
+
+    def release(self):
+        """Frees a slot, handing it to the best waiter if there is one."""
+        while self._waiting:
+            entry = heapq.heappop(self._waiting)
+            if not entry[2].done():
+                entry[2].set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def _remove(self, entry):
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        QUEUE_DEPTH.labels(service=self.service_name).set(len(self._waiting))
+        ADMITTED_IN_FLIGHT.labels(service=self.service_name).set(self.active)
+
+admission_queues = {
+    name: AdmissionQueue(name, MAX_CONCURRENCY[name], MAX_QUEUE[name])
+    for name in SERVICE_URLS
+}
+
+def request_priority(request: Request) -> str:
+    priority = request.headers.get("x-priority", "").strip().lower()
+    if priority in PRIORITY_CLASSES:
+        return priority
+    priority = CALLER_PRIORITIES.get(request.headers.get("x-caller", "").strip().lower(), DEFAULT_PRIORITY)
+    return priority if priority in PRIORITY_CLASSES else "interactive"
+
+def overloaded_response(error: Overloaded) -> Response:
+    return Response(
+        content=f"Request shed by the gateway: {error.reason}.",
+        status_code=error.status_code,
+        headers={"Retry-After": "1" if error.status_code == 429 else str(max(1, int(QUEUE_TIMEOUT / 10)))},
+    )
+
+class NoReplicaAvailable(Exception):
+    """Every replica of a service is unhealthy or has an open breaker."""
+
+class Replica:
+    """
+    One backend instance: its health, outstanding request count, and a circuit
+    breaker that is closed, open (ejected) or half-open (one trial request).
+    """
+
+    def __init__(self, service_name: str, url: str):
+        self.service_name = service_name
+        self.url = url
+        self.health_url = str(httpx.URL(url).copy_with(path="/healthz", query=None))
+        self.healthy = True
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._update_gauges()
+
+    @property
+    def breaker_state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        if not self.healthy:
+            return False
+        state = self.breaker_state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def acquire(self) -> bool:
+        """Counts a request against this replica; returns True if it is the half-open trial."""
+        trial = self.breaker_state == "half_open"
+        if trial:
+            self.trial_in_flight = True
+        self.outstanding += 1
+        self._update_gauges()
+        return trial
+
+    def release(self):
+        self.outstanding -= 1
+        self._update_gauges()
+
+    def record(self, ok: bool):
+        """Feeds one request outcome into the breaker."""
+        half_open = self.breaker_state == "half_open"
+        self.trial_in_flight = False
+        if ok:
+            self.consecutive_failures = 0
+            if self.opened_at is not None:
+                print(f"--- Breaker closed for {self.service_name} replica {self.url} ---")
+                self.opened_at = None
+        else:
+            self.consecutive_failures += 1
+            if half_open or (self.opened_at is None and self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD):
+                print(f"--- Breaker opened for {self.service_name} replica {self.url} after {self.consecutive_failures} failures ---")
+                self.opened_at = time.monotonic()
+                BREAKER_TRIPS.labels(service=self.service_name, replica=self.url).inc()
+        self._update_gauges()
+
+    def set_healthy(self, healthy: bool, reason: str = ""):
+        if healthy != self.healthy:
+            print(f"--- {self.service_name} replica {self.url} is {'healthy' if healthy else 'unhealthy'}{f': {reason}' if reason else ''} ---")
+        self.healthy = healthy
+        self._update_gauges()
+
+    def status(self) -> dict:
+        return {"url": self.url, "healthy": self.healthy, "breaker": self.breaker_state, "outstanding": self.outstanding}
+
+    def _update_gauges(self):
+        REPLICA_OUTSTANDING.labels(service=self.service_name, replica=self.url).set(self.outstanding)
+        REPLICA_UP.labels(service=self.service_name, replica=self.url).set(int(self.healthy and self.breaker_state == "closed"))
+
+replica_pools = {
+    name: [Replica(name, url) for url in urls]
+    for name, urls in SERVICE_REPLICAS.items()
+}
+
+def resolve_route(route: str):
+    """(service, backend path override or None) for a route name; service is None if the route is unknown."""
+    if route in ROUTE_ALIASES:
+        return ROUTE_ALIASES[route]
+    return (route if route in replica_pools else None), None
+
+def backend_url(url: str, path: str = None) -> str:
+    return url if path is None else str(httpx.URL(url).copy_with(path=path))
+
+def pick_replica(service_name: str, exclude=()):
+    """Least outstanding requests among available replicas, ties broken at random."""
+    candidates = [replica for replica in replica_pools[service_name] if replica not in exclude and replica.available()]
+    if not candidates:
+        return None
+    fewest = min(replica.outstanding for replica in candidates)
+    return random.choice([replica for replica in candidates if replica.outstanding == fewest])
+
+async def send_to_replica(service_name: str, make_request, stream: bool = False):
+    """
+    Sends a request built by `make_request(url)` to the best replica, failing
+    over to the next one when a connection cannot be opened (nothing was sent
+    yet, so the retry is safe). Returns (replica, response); the caller must
+    release the replica once it is done with the response.
+    """
+    client = backend_clients[service_name]
+    tried = []
+    last_error = None
+    while True:
+        replica = pick_replica(service_name, exclude=tried)
+        if replica is None:
+            if last_error is not None:
+                # Every available replica refused the connection; report the last refusal
+                raise last_error
+            NO_REPLICA.labels(service=service_name).inc()
+            raise NoReplicaAvailable(service_name)
+        tried.append(replica)
+        trial = replica.acquire()
+        try:
+            response = await client.send(make_request(replica.url), stream=stream)
+        except httpx.ConnectError as e:
+            replica.record(False)
+            replica.release()
+            last_error = e
+            continue
+        except httpx.RequestError:
+            replica.record(False)
+            replica.release()
+            raise
+        except BaseException:
+            # Cancelled (e.g. the client went away): no verdict on the replica,
+            # but a trial must not stay in flight or the replica is never picked again
+            if trial:
+                replica.trial_in_flight = False
+            replica.release()
+            raise
+        replica.record(response.status_code < 500)
+        return replica, response
+
+def no_replica_response(service_name: str) -> Response:
+    return Response(
+        content=f"No healthy replica of backend service '{service_name}' is available.",
+        status_code=503,
+        headers={"Retry-After": str(max(1, int(HEALTH_CHECK_INTERVAL)))},
+    )
+
+async def check_replica(replica: Replica):
+    """DocQA answers /healthz with status "loading" until its index is built, so anything but "ok" counts as down."""
+    try:
+        response = await backend_clients[replica.service_name].get(replica.health_url, timeout=HEALTH_CHECK_TIMEOUT)
+        health = response.json() if response.status_code == 200 else {}
+        status = health.get("status") if response.status_code == 200 else f"HTTP {response.status_code}"
+    except (httpx.HTTPError, ValueError, AttributeError) as e:
+        health, status = {}, f"{type(e).__name__}: {e}"
+    replica.set_healthy(status == "ok", reason=str(status))
+    note_answers_version(replica.service_name, health.get("answers_version"))
+
+def note_answers_version(service_name: str, version):
+    """Drops a service's cached responses once it reports new answers (e.g. DocQA after a reindex)."""
+    if version is None:
+        return
+    previous = answers_versions.get(service_name)
+    answers_versions[service_name] = version
+    if previous is not None and previous != version:
+        dropped = response_cache.invalidate(service_name)
+        print(f"--- {service_name} answers changed ({previous} -> {version}), dropped {dropped} cached response(s) ---")
+
+async def health_check_loop():
+    while True:
+        await asyncio.gather(*(check_replica(replica) for pool in replica_pools.values() for replica in pool))
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+@app.on_event("startup")
+async def startup_event():
+    limits = httpx.Limits(
+        max_connections=BACKEND_MAX_CONNECTIONS,
+        max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+        keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(BACKEND_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT)
+    for service_name in SERVICE_URLS:
+        backend_clients[service_name] = httpx.AsyncClient(limits=limits, timeout=timeout)
+    app.state.health_checker = asyncio.create_task(health_check_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.health_checker.cancel()
+    for client in backend_clients.values():
+        await client.aclose()
+
+def forwardable_headers(raw_headers, drop=()) -> list:
+    """
+    Strips hop-by-hop headers, including any that the Connection header
+    names, plus anything in `drop`. Names are lower-cased as ASGI expects.
+    """
+    excluded = HOP_BY_HOP_HEADERS | set(drop)
+    for name, value in raw_headers:
+        if name.lower() == b"connection":
+            excluded |= {token.strip().lower() for token in value.decode("latin-1").split(",")}
+    return [
+        (name.lower(), value)
+        for name, value in raw_headers
+        if name.decode("latin-1").lower() not in excluded
+    ]
+
+def cache_key(service_name: str, body: bytes):
+    """Hash of the canonical JSON body, so key order and whitespace do not matter; None if not JSON."""
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return None
+    return (service_name, hashlib.sha256(canonical.encode("utf-8")).hexdigest())
+
+def cached_response(entry: dict, cache_status: str) -> Response:
+    response = Response(content=entry["body"], status_code=entry["status_code"])
+    response.raw_headers = entry["headers"] + [(b"content-length", str(len(entry["body"])).encode()), (b"x-cache", cache_status.encode())]
+    return response
+
+async def fetch_buffered(service_name: str, headers: list, body: bytes, priority: str, path: str = None) -> dict:
+    client = backend_clients[service_name]
+    await admission_queues[service_name].acquire(priority)
+    try:
+        replica, backend_response = await send_to_replica(
+            service_name, lambda url: client.build_request("POST", backend_url(url, path), headers=headers, content=body)
+        )
+    finally:
+        admission_queues[service_name].release()
+    replica.release()
+    return {
+        "status_code": backend_response.status_code,
+        # The body is stored decoded, so length and encoding headers are recomputed on the way out
+        "headers": forwardable_headers(backend_response.headers.raw, drop={"date", "server", "content-length", "content-encoding"}),
+        "body": backend_response.content,
+    }
+
+async def fetch_cached(service_name: str, key: tuple, headers: list, body: bytes, priority: str, revalidate: bool = False, path: str = None):
+    """
+    Returns (entry, cache status) for a cacheable request. Concurrent identical
+    requests are coalesced into a single backend call (single flight). The
+    key's first element is the route, so aliases get their own namespace.
+    """
+    route = key[0]
+    if not revalidate:
+        entry = response_cache.get(key)
+        if entry is not None:
+            CACHE_REQUESTS.labels(service=route, result="hit").inc()
+            return entry, "HIT"
+
+    # One backend call per key; it runs as its own task so a caller that goes away cannot cancel it for the rest.
+    task = inflight_requests.get(key)
+    if task is not None:
+        cache_status = "COALESCED"
+    else:
+        cache_status = "MISS"
+        task = asyncio.create_task(fetch_buffered(service_name, headers, body, priority, path))
+        inflight_requests[key] = task
+        task.add_done_callback(lambda done: store_fetched(key, done))
+    CACHE_REQUESTS.labels(service=route, result=cache_status.lower()).inc()
+    return await asyncio.shield(task), cache_status
+
+async def route_cached(route: str, request: Request, priority: str) -> Response:
+    """Serves an opt-in route from the response cache."""
+    service_name, path = resolve_route(route)
+    body = await request.body()
+    key = cache_key(route, body)
+    if key is None:
+        CACHE_REQUESTS.labels(service=route, result="bypass").inc()
+        return await route_streaming(service_name, request, priority, body=body, path=path)
+
+    headers = forwardable_headers(request.headers.raw, drop={"host", "content-length"})
+    revalidate = "no-cache" in request.headers.get("cache-control", "")
+    try:
+        entry, cache_status = await fetch_cached(service_name, key, headers, body, priority, revalidate, path)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except NoReplicaAvailable:
+        return no_replica_response(service_name)
+    except httpx.RequestError as e:
+        return Response(content=f"Error communicating with backend service '{service_name}': {e}", status_code=502)
+    return cached_response(entry, cache_status)
+
+def store_fetched(key: tuple, task: asyncio.Task):
+    inflight_requests.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    entry = task.result()
+    if entry["status_code"] == 200:
+        response_cache.put(key, entry, CACHE_TTLS[key[0]])
+
+def batch_item_payload(item: dict):
+    """
+    Encodes a sub-request the way its single-service route would receive it:
+    {"json": {...}} as a JSON body, or {"files": {field: {"filename",
+    "content_type", "content_b64"}}} as a multipart upload.
+    """
+    if "files" in item:
+        files = {
+            field: (spec.get("filename", field), base64.b64decode(spec["content_b64"]), spec.get("content_type", "application/octet-stream"))
+            for field, spec in item["files"].items()
+        }
+        encoded = httpx.Request("POST", "http://backend", files=files, data=item.get("data"))
+    else:
+        encoded = httpx.Request("POST", "http://backend", json=item.get("json", {}))
+    return [(b"content-type", encoded.headers["content-type"].encode("latin-1"))], encoded.read()
+
+async def run_batch_item(index: int, item: dict, priority: str, revalidate: bool = False) -> dict:
+    route = item.get("service") if isinstance(item, dict) else None
+    result = {"index": index, "service": route}
+    service_name, path = resolve_route(route)
+    if service_name is None:
+        return {**result, "status_code": 404, "error": f"Service '{route}' not found."}
+    try:
+        headers, body = batch_item_payload(item)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return {**result, "status_code": 400, "error": f"Malformed sub-request: {e}"}
+
+    key = cache_key(route, body) if route in CACHE_TTLS and "files" not in item else None
+    try:
+        if key is not None:
+            entry, result["cache"] = await fetch_cached(service_name, key, headers, body, priority, revalidate, path)
+        else:
+            entry = await fetch_buffered(service_name, headers, body, priority, path)
+    except Overloaded as e:
+        return {**result, "status_code": e.status_code, "error": e.reason}
+    except NoReplicaAvailable:
+        return {**result, "status_code": 503, "error": f"No healthy replica of backend service '{service_name}' is available."}
+    except httpx.RequestError as e:
+        return {**result, "status_code": 502, "error": f"Error communicating with backend service '{service_name}': {e}"}
+
+    result["status_code"] = entry["status_code"]
+    content_type = dict(entry["headers"]).get(b"content-type", b"").decode("latin-1")
+    try:
+        result["body"] = json.loads(entry["body"]) if "json" in content_type else None
+    except ValueError:
+        result["body"] = None
+    if result["body"] is None:
+        result["text"] = entry["body"].decode("utf-8", errors="replace")
+    return result
+
+@app.post("/route/batch")
+async def route_batch(request: Request, stream: bool = False):
+    """
+    Fans a list of sub-requests ({"requests": [{"service": ..., "json" | "files": ...}]})
+    out to the backends concurrently, at the batch's priority, and returns one
+    result per item with its own status_code. Results come back in request
+    order, or with ?stream=true as NDJSON lines in completion order (each
+    carries its index). Cache-Control: no-cache skips cached answers for
+    every item, as it does on the single-service routes.
+    """
+    try:
+        items = (await request.json())["requests"]
+        if not isinstance(items, list):
+            raise TypeError("'requests' must be a list")
+    except (ValueError, KeyError, TypeError) as e:
+        return Response(content=f'Expected a JSON body of the form {{"requests": [...]}}: {e}', status_code=400)
+    if len(items) > GATEWAY_MAX_BATCH:
+        return Response(content=f"A batch holds at most {GATEWAY_MAX_BATCH} sub-requests.", status_code=413)
+
+    priority = request_priority(request)
+    revalidate = "no-cache" in request.headers.get("cache-control", "")
+    tasks = [asyncio.create_task(run_batch_item(index, item, priority, revalidate)) for index, item in enumerate(items)]
+    if not (stream or "application/x-ndjson" in request.headers.get("accept", "")):
+        return {"results": await asyncio.gather(*tasks)}
+
+    async def results():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # The caller went away; drop whatever has not finished yet
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app.post("/route/{service_name}")
 async def route_request(service_name: str, request: Request):
     """
-    Receives a request, finds the correct backend service,
-    and forwards the request body and headers to it.
+    Receives a request, finds the correct backend service, and forwards it:
+    from the response cache for opt-in routes, streamed for everything else.
+    Backend calls go through the service's admission queue at the request's priority.
     """
-    if service_name not in SERVICE_URLS:
+    backend_service, path = resolve_route(service_name)
+    if backend_service is None:
         return Response(content=f"Service '{service_name}' not found.", status_code=404)
+    priority = request_priority(request)
+    if service_name in CACHE_TTLS:
+        return await route_cached(service_name, request, priority)
+    return await route_streaming(backend_service, request, priority, path=path)
 
-    backend_url = SERVICE_URLS[service_name]
+async def route_streaming(service_name: str, request: Request, priority: str, body: bytes = None, path: str = None) -> Response:
+    """
+    Streams the request body to the backend and its response back, without
+    buffering either (unless the caller already read the body). The admission
+    slot is held until the response has been relayed.
+    """
+    try:
+        await admission_queues[service_name].acquire(priority)
+    except Overloaded as e:
+        return overloaded_response(e)
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        # Build a new request that mirrors the original one
-        backend_request = client.build_request(
-            method=request.method,
-            url=backend_url,
-            headers=request.headers.raw,
-            content=await request.body(),
-        )
+    client = backend_clients[service_name]
+    headers = forwardable_headers(request.headers.raw, drop={"host"})
+    content = request.stream() if body is None else body
+    # Build a new request that mirrors the original one; httpx sets Host for the backend
+    def make_request(url):
+        return client.build_request(method=request.method, url=backend_url(url, path), headers=headers, content=content)
+
+    try:
+        replica, backend_response = await send_to_replica(service_name, make_request, stream=True)
+    except NoReplicaAvailable:
+        admission_queues[service_name].release()
+        return no_replica_response(service_name)
+    except httpx.RequestError as e:
+        admission_queues[service_name].release()
+        error_message = f"Error communicating with backend service '{service_name}': {e}"
+        return Response(content=error_message, status_code=502) # 502 Bad Gateway
+    except BaseException:
+        admission_queues[service_name].release()
+        raise
+
+    released = False
+    async def finish():
+        nonlocal released
+        if not released:
+            released = True
+            await backend_response.aclose()
+            replica.release()
+            admission_queues[service_name].release()
 
+    async def relay():
+        # Also runs finish() when the caller disconnects mid-stream, which skips the background task
         try:
-            # Send the mirrored request to the backend service
-            backend_response = await client.send(backend_request)
-
-            # Return the response from the backend service back to the original caller
-            return Response(
-                content=backend_response.content,
-                status_code=backend_response.status_code,
-                headers=dict(backend_response.headers),
-            )
-        except httpx.RequestError as e:
-            error_message = f"Error communicating with backend service '{service_name}': {e}"
-            return Response(content=error_message, status_code=502) # 502 Bad Gateway
+            async for chunk in backend_response.aiter_raw():
+                yield chunk
+        finally:
+            await finish()
+
+    # Relay the raw (still encoded) bytes as they arrive; the connection goes back to the pool once done
+    response = StreamingResponse(
+        relay(),
+        status_code=backend_response.status_code,
+        background=BackgroundTask(finish),
+    )
+    # uvicorn adds its own Date and Server headers
+    response.raw_headers = forwardable_headers(backend_response.headers.raw, drop={"date", "server"})
+    return response
+
+@app.post("/cache/invalidate")
+def invalidate_cache(service: str = None):
+    """Drops cached responses for one service (e.g. after a runbook change), or for all of them."""
+    return {"invalidated": response_cache.invalidate(service)}
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok", "configured_services": list(SERVICE_URLS.keys())}
\ No newline at end of file
+    return {
+        "status": "ok",
+        "configured_services": list(replica_pools.keys()),
+        "route_aliases": {route: f"{service}{path}" for route, (service, path) in ROUTE_ALIASES.items()},
+        "replicas": {name: [replica.status() for replica in pool] for name, pool in replica_pools.items()},
+    }
@@ -1,58 +1,565 @@
 import os
-from fastapi import FastAPI
+import re
+import glob
+import json
+import math
+import time
+import asyncio
+import hashlib
+import threading
+import faiss
+import torch
+import numpy as np
+from fastapi import FastAPI, HTTPException, Response
+from prometheus_client import Histogram, CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 from langchain.vectorstores import FAISS
 from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.document_loaders import DirectoryLoader
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.document_loaders import UnstructuredFileLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from transformers import pipeline
+from transformers import AutoModelForQuestionAnswering, AutoTokenizer, pipeline
 
 # --- Global Variables ---
-# We will load the models and build the index on startup
+# We will load the models and the index on startup
 vector_store = None
+lexical_index = None
 qa_pipeline = None
+embeddings = None
 runbooks_path = "/data/runbooks"
 
+# --- Inference Backend ---
+# DOCQA_DEVICE is auto (CUDA when available), cuda or cpu. On CPU,
+# DOCQA_CPU_BACKEND picks fp32, int8 (dynamic quantization of every Linear
+# layer) or onnx (the QA model exported to ONNX Runtime, embeddings in int8).
+DEVICE = os.getenv("DOCQA_DEVICE", "auto")
+CPU_BACKEND = os.getenv("DOCQA_CPU_BACKEND", "int8")
+# Intra-op threads for PyTorch and ONNX Runtime on CPU; 0 means one per core
+NUM_THREADS = int(os.getenv("DOCQA_NUM_THREADS", "0"))
+QA_MODEL = "deepset/roberta-base-squad2"
+
+def resolve_backend(device: str = DEVICE, cpu_backend: str = CPU_BACKEND) -> str:
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    return "cuda-fp32" if device == "cuda" else f"cpu-{cpu_backend}"
+
+INFERENCE_BACKEND = resolve_backend()
+
+# --- Index Persistence ---
+# The FAISS index, its chunks and a manifest of per-file content hashes live
+# here, so a restart only embeds runbooks that changed since the last save.
+INDEX_DIR = os.getenv("DOCQA_INDEX_DIR", "/data/index")
+MANIFEST_FILE = "manifest.json"
+INDEX_FILES = ("index.faiss", "index.pkl")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# How often to look for runbook changes; 0 leaves it to POST /reindex
+REINDEX_INTERVAL = float(os.getenv("DOCQA_REINDEX_INTERVAL", "60"))
+
+# --- Micro-batching ---
+# Concurrent /ask calls are gathered for up to ASK_MAX_WAIT_MS (or until
+# ASK_MAX_BATCH questions are waiting) and answered with one embedding call,
+# one FAISS search (for questions the lexical index cannot settle) and at most
+# two batched QA passes.
+ASK_MAX_BATCH = int(os.getenv("DOCQA_MAX_BATCH_SIZE", "16"))
+ASK_MAX_WAIT_MS = float(os.getenv("DOCQA_MAX_BATCH_WAIT_MS", "5"))
+# Retrieved chunks are read one sequence each, up to this many chunk tokens per question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("DOCQA_CONTEXT_TOKEN_BUDGET", "1024"))
+# A top-chunk answer scoring at least this skips the remaining chunks
+EARLY_STOP_SCORE = float(os.getenv("DOCQA_EARLY_STOP_SCORE", "0.5"))
+
+BATCH_SIZE = Histogram("docqa_batch_size", "Questions answered per batch", buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_WAIT = Histogram(
+    "docqa_batch_wait_seconds", "Time a question waited for its batch to start",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+BATCH_DURATION = Histogram(
+    "docqa_batch_duration_seconds", "Time to answer one batch",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# --- Lexical Fast Path ---
+# Templated questions naming an alert, or matching runbook terms strongly
+# enough, skip the embedding model and FAISS entirely.
+# Share of the question's BM25 weight the best chunk must match to skip vector search
+LEXICAL_MIN_MATCH = float(os.getenv("DOCQA_LEXICAL_MIN_MATCH", "0.8"))
+# Weight of a runbook's headings relative to its body text in BM25
+HEADING_WEIGHT = 2
+# Reciprocal rank fusion constant for hybrid ranking
+RRF_K = 60
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_.\-]*")
+ALERT_NAME_PATTERN = re.compile(r"\b[A-Z][a-z0-9]+(?:[A-Z][a-z0-9]*)+\b")
+HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "of", "on", "or", "the", "this", "to", "what", "when", "which", "who", "why", "with", "you",
+}
+
+# Runbook path -> {"sha256": ..., "ids": [chunk ids in the docstore]}
+manifest = {}
+# Serialises reindexing; queries never take it
+reindex_lock = threading.Lock()
+
 # --- FastAPI App Initialization ---
 app = FastAPI(title="Document QA Service")
 
 @app.on_event("startup")
 def startup_event():
     """
-    On startup, load models and build the document index.
-    This is a one-time process.
+    On startup, load models and the saved index, then embed only the
+    runbooks that were added or changed since it was saved.
     """
-    global vector_store, qa_pipeline
+    global qa_pipeline, embeddings
 
-    print("--- Loading models and building index ---")
+    print(f"--- Loading models and index ({INFERENCE_BACKEND}) ---")
 
     # 1. Load the embedding model
     print("Loading embedding model...")
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    embeddings = load_embeddings(INFERENCE_BACKEND)
 
-    # 2. Load the runbook documents from the /data/runbooks directory
-    print(f"Loading documents from {runbooks_path}...")
-    loader = DirectoryLoader(runbooks_path, glob="**/*.md", show_progress=True)
-    documents = loader.load()
+    # 2. Load the saved FAISS store and bring it up to date with /data/runbooks
+    load_index()
+    summary = reindex()
+    print(f"--- Index is ready: {summary} ---")
 
-    # 3. Split documents into smaller chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    texts = text_splitter.split_documents(documents)
+    # 3. Load the Question-Answering pipeline
+    print("Loading QA pipeline...")
+    qa_pipeline = load_qa_pipeline(INFERENCE_BACKEND)
+    print("--- QA pipeline is ready ---")
 
-    # 4. Create the FAISS vector store (the index) from the chunks
-    print("Creating FAISS vector store...")
-    vector_store = FAISS.from_documents(texts, embeddings)
-    print("--- Index is ready ---")
+    if REINDEX_INTERVAL > 0:
+        threading.Thread(target=watch_runbooks, daemon=True).start()
 
-    # 5. Load the Question-Answering pipeline
-    print("Loading QA pipeline...")
-    qa_pipeline = pipeline(
-        "question-answering", 
-        model="deepset/roberta-base-squad2", 
-        tokenizer="deepset/roberta-base-squad2",
-        device="cuda:0"
+@app.on_event("startup")
+async def start_batcher():
+    ask_batcher.start()
+
+
+# --- Model Loading ---
+def cpu_threads() -> int:
+    return NUM_THREADS or os.cpu_count() or 1
+
+def quantize(model):
+    """Dynamic int8 quantization: Linear weights stored as int8, activations quantized on the fly."""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def embedding_precision(backend: str) -> str:
+    return "int8" if backend in ("cpu-int8", "cpu-onnx") else "fp32"
+
+def load_embeddings(backend: str) -> HuggingFaceEmbeddings:
+    on_cpu = backend.startswith("cpu")
+    if on_cpu:
+        torch.set_num_threads(cpu_threads())
+    model = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={"device": "cpu" if on_cpu else "cuda"},
+        encode_kwargs={"batch_size": 64},
     )
-    print("--- QA pipeline is ready ---")
+    if embedding_precision(backend) == "int8":
+        model.client = quantize(model.client)
+    return model
+
+def load_qa_pipeline(backend: str):
+    tokenizer = AutoTokenizer.from_pretrained(QA_MODEL)
+    if backend == "cuda-fp32":
+        return pipeline("question-answering", model=QA_MODEL, tokenizer=tokenizer, device="cuda:0")
+
+    torch.set_num_threads(cpu_threads())
+    if backend == "cpu-onnx":
+        # Only needed for this backend
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForQuestionAnswering
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = cpu_threads()
+        # The export takes a while, so keep it next to the index
+        export_dir = os.path.join(INDEX_DIR, "onnx", QA_MODEL.replace("/", "--"))
+        if os.path.exists(os.path.join(export_dir, "model.onnx")):
+            model = ORTModelForQuestionAnswering.from_pretrained(export_dir, session_options=options)
+        else:
+            print(f"Exporting {QA_MODEL} to ONNX...")
+            model = ORTModelForQuestionAnswering.from_pretrained(QA_MODEL, export=True, session_options=options)
+            model.save_pretrained(export_dir)
+        return pipeline("question-answering", model=model, tokenizer=tokenizer)
+
+    model = AutoModelForQuestionAnswering.from_pretrained(QA_MODEL).eval()
+    if backend == "cpu-int8":
+        model = quantize(model)
+    return pipeline("question-answering", model=model, tokenizer=tokenizer, device="cpu")
+
+
+# --- Index Management ---
+def index_settings() -> dict:
+    """Anything that makes saved vectors incompatible; a mismatch forces a full rebuild."""
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_precision": embedding_precision(INFERENCE_BACKEND),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+def load_index():
+    global vector_store, manifest
+    manifest_path = os.path.join(INDEX_DIR, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        print(f"No saved index in {INDEX_DIR}, building from scratch...")
+        return
+    try:
+        with open(manifest_path) as f:
+            saved = json.load(f)
+        if saved.get("settings") != index_settings():
+            print("Saved index was built with different settings, rebuilding from scratch...")
+            return
+        # A crash partway through save_index can leave files from two different saves
+        checksums = {name: file_sha256(os.path.join(INDEX_DIR, name)) for name in INDEX_FILES}
+        if saved.get("checksums") != checksums:
+            print("Saved index files do not match the manifest, rebuilding from scratch...")
+            return
+        vector_store = FAISS.load_local(INDEX_DIR, embeddings, allow_dangerous_deserialization=True)
+        manifest = saved["files"]
+        publish_lexical_index(vector_store)
+        print(f"Loaded saved index with {vector_store.index.ntotal} chunks from {len(manifest)} runbooks")
+    except Exception as e:
+        print(f"--- WARNING: Could not load saved index ({e}), rebuilding from scratch ---")
+        vector_store, manifest = None, {}
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def copy_store(store: FAISS) -> FAISS:
+    """A private copy to modify while queries keep reading the original."""
+    return FAISS(
+        embedding_function=store.embedding_function,
+        index=faiss.clone_index(store.index),
+        docstore=InMemoryDocstore(dict(store.docstore._dict)),
+        index_to_docstore_id=dict(store.index_to_docstore_id),
+    )
+
+def reindex() -> dict:
+    """
+    Applies runbook additions, edits and deletions to the index. Only changed
+    files are split and embedded; the result is built on a copy of the store
+    and swapped in at the end, so queries are never paused. Saves the index
+    and manifest when anything changed.
+    """
+    global vector_store, manifest
+    with reindex_lock:
+        started = time.perf_counter()
+        current = {
+            path: file_sha256(path)
+            for path in sorted(glob.glob(os.path.join(runbooks_path, "**/*.md"), recursive=True))
+        }
+        added = [path for path in current if path not in manifest]
+        updated = [path for path in current if path in manifest and manifest[path]["sha256"] != current[path]]
+        deleted = [path for path in manifest if path not in current]
+        if vector_store is None:
+            added, updated, deleted = list(current), [], []
+        summary = {"added": len(added), "updated": len(updated), "deleted": len(deleted)}
+        if not (added or updated or deleted):
+            summary["chunks"] = vector_store.index.ntotal if vector_store else 0
+            return summary
+
+        # 1. Split and embed the new and changed files (the slow part)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        new_files = {}
+        texts, metadatas, ids = [], [], []
+        for path in added + updated:
+            chunks = text_splitter.split_documents(UnstructuredFileLoader(path).load())
+            chunk_ids = [f"{path}#{current[path][:12]}-{i}" for i in range(len(chunks))]
+            new_files[path] = {"sha256": current[path], "ids": chunk_ids}
+            texts += [chunk.page_content for chunk in chunks]
+            metadatas += [chunk.metadata for chunk in chunks]
+            ids += chunk_ids
+        vectors = embeddings.embed_documents(texts) if texts else []
+
+        # 2. Apply everything to a copy and swap it in
+        if vector_store is None:
+            if not texts:
+                print(f"--- WARNING: No runbooks found in {runbooks_path} ---")
+                return {**summary, "chunks": 0}
+            store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+        else:
+            store = copy_store(vector_store)
+            stale_ids = [chunk_id for path in updated + deleted for chunk_id in manifest[path]["ids"]]
+            if stale_ids:
+                store.delete(stale_ids)
+            if texts:
+                store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        new_manifest = {path: entry for path, entry in manifest.items() if path in current}
+        new_manifest.update(new_files)
+        publish_lexical_index(store)
+        vector_store, manifest = store, new_manifest
+
+        save_index(store, new_manifest)
+        summary["chunks"] = store.index.ntotal
+        print(f"--- Reindexed runbooks in {time.perf_counter() - started:.1f}s: {summary} ---")
+        return summary
+
+def save_index(store: FAISS, files: dict):
+    """
+    Writes the store, then the manifest, each replaced atomically. The
+    manifest records the checksum of each store file so load_index can tell
+    when a crash left the three files from different saves.
+    """
+    staging = os.path.join(INDEX_DIR, ".staging")
+    os.makedirs(staging, exist_ok=True)
+    store.save_local(staging)
+    checksums = {name: file_sha256(os.path.join(staging, name)) for name in INDEX_FILES}
+    for name in INDEX_FILES:
+        os.replace(os.path.join(staging, name), os.path.join(INDEX_DIR, name))
+    manifest_tmp = os.path.join(staging, MANIFEST_FILE)
+    with open(manifest_tmp, "w") as f:
+        json.dump({"settings": index_settings(), "checksums": checksums, "files": files}, f)
+    os.replace(manifest_tmp, os.path.join(INDEX_DIR, MANIFEST_FILE))
+
+def lexical_terms(text: str) -> list:
+    terms = (term.strip(".-") for term in TOKEN_PATTERN.findall(text.lower()))
+    return [term for term in terms if term and term not in STOPWORDS]
+
+def read_headings(path: str) -> list:
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return HEADING_PATTERN.findall(f.read())
+    except OSError:
+        return []
+
+class LexicalIndex:
+    """
+    Inverted index over the vector store's chunks. Alert names (CamelCase
+    identifiers such as ToyProdHighLatency) map straight to the chunks that
+    mention them, and every term feeds a BM25 ranking in which a runbook's
+    headings count towards each of its chunks.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, docs: dict):
+        self.docs = docs
+        self.alert_names = {}
+        self.postings = {}
+        self.lengths = {}
+        headings = {}
+        for doc_id, doc in docs.items():
+            source = doc.metadata.get("source", "")
+            if source not in headings:
+                headings[source] = " ".join(read_headings(source))
+            terms = lexical_terms(doc.page_content) + lexical_terms(headings[source]) * HEADING_WEIGHT
+            self.lengths[doc_id] = len(terms)
+            for term in terms:
+                counts = self.postings.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+            for name in set(ALERT_NAME_PATTERN.findall(doc.page_content)):
+                self.alert_names.setdefault(name.lower(), []).append(doc_id)
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 1.0
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> dict:
+        """BM25 score of every chunk sharing a term with the query."""
+        scores = {}
+        for term in set(lexical_terms(query)):
+            counts = self.postings.get(term)
+            if not counts:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in counts.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Top k (chunk id, match) pairs by BM25, where match is the score relative
+        to an average-length chunk containing every query term once (unknown
+        terms count at the highest idf), so it means the same at any corpus size.
+        """
+        weight = sum(self.idf(term) for term in set(lexical_terms(query)))
+        if weight == 0:
+            return []
+        ranked = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(doc_id, score / weight) for doc_id, score in ranked]
+
+    def match_alert(self, query: str, k: int) -> list:
+        """Chunks naming an alert that the query names, best BM25 match first; empty if none."""
+        for name in ALERT_NAME_PATTERN.findall(query):
+            doc_ids = self.alert_names.get(name.lower())
+            if doc_ids:
+                scores = self.scores(query)
+                return sorted(doc_ids, key=lambda doc_id: scores.get(doc_id, 0.0), reverse=True)[:k]
+        return []
+
+def publish_lexical_index(store: FAISS):
+    global lexical_index
+    lexical_index = LexicalIndex(dict(store.docstore._dict))
+    print(f"Lexical index covers {len(lexical_index.postings)} terms and {len(lexical_index.alert_names)} alert names")
+
+def watch_runbooks():
+    while True:
+        time.sleep(REINDEX_INTERVAL)
+        try:
+            reindex()
+        except Exception as e:
+            print(f"--- ERROR: Reindexing runbooks failed: {e} ---")
+
+
+# --- Batched Answering ---
+def run_qa(pairs: list) -> list:
+    """One batched forward pass; the pipeline returns a bare dict for a single input."""
+    if not pairs:
+        return []
+    answers = qa_pipeline(pairs, batch_size=len(pairs))
+    return [answers] if isinstance(answers, dict) else list(answers)
+
+def chunk_tokens(doc) -> int:
+    return len(qa_pipeline.tokenizer(doc.page_content, add_special_tokens=False)["input_ids"])
+
+def within_budget(docs: list) -> list:
+    """Chunks in rank order up to CONTEXT_TOKEN_BUDGET tokens (always at least one)."""
+    kept, used = [], 0
+    for doc in docs:
+        used += chunk_tokens(doc)
+        if kept and used > CONTEXT_TOKEN_BUDGET:
+            break
+        kept.append(doc)
+    return kept
+
+def retrieve(store: FAISS, lexical: LexicalIndex, questions: list):
+    """
+    Picks each question's top_k chunks and the path that found them:
+    "alert_name" for an exact alert match, "lexical" for a BM25 match of at
+    least LEXICAL_MIN_MATCH, otherwise "hybrid", which fuses the BM25 and
+    vector rankings. Only hybrid questions are embedded, in one call, and
+    searched in one FAISS call.
+    """
+    candidates, paths, hybrid = [None] * len(questions), [None] * len(questions), []
+    for index, (query, top_k) in enumerate(questions):
+        doc_ids = lexical.match_alert(query, top_k)
+        if doc_ids:
+            candidates[index], paths[index] = [lexical.docs[doc_id] for doc_id in doc_ids], "alert_name"
+            continue
+        ranked = lexical.search(query, top_k)
+        if ranked and ranked[0][1] >= LEXICAL_MIN_MATCH:
+            candidates[index], paths[index] = [lexical.docs[doc_id] for doc_id, _ in ranked], "lexical"
+            continue
+        hybrid.append(index)
+
+    if hybrid:
+        depth = 2 * max(questions[index][1] for index in hybrid)
+        vectors = np.asarray(embeddings.embed_documents([questions[index][0] for index in hybrid]), dtype=np.float32)
+        _, neighbours = store.index.search(vectors, depth)
+        for index, row in zip(hybrid, neighbours):
+            query, top_k = questions[index]
+            rankings = [
+                [store.index_to_docstore_id[i] for i in row if i != -1],
+                [doc_id for doc_id, _ in lexical.search(query, depth)],
+            ]
+            fused = {}
+            for ranking in rankings:
+                for rank, doc_id in enumerate(ranking):
+                    fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            best_ids = sorted(fused, key=fused.get, reverse=True)[:top_k]
+            candidates[index] = [store.docstore._dict.get(doc_id) or lexical.docs[doc_id] for doc_id in best_ids]
+            paths[index] = "hybrid"
+    return candidates, paths
+
+def answer_batch(store: FAISS, lexical: LexicalIndex, questions: list) -> list:
+    """
+    Answers (query, top_k) pairs together. Every retrieved chunk is scored as
+    its own sequence, so the answer's source is the chunk it came from. Each
+    question's top chunk goes first in one batched pass; only questions
+    without an answer scoring EARLY_STOP_SCORE get their remaining chunks, up
+    to CONTEXT_TOKEN_BUDGET tokens, in a second pass. Returns one result dict,
+    or None when nothing was retrieved, per question.
+    """
+    # 1. Find each question's chunks, lexically where that is enough
+    candidates, paths = retrieve(store, lexical, questions)
+    candidates = [within_budget(docs) for docs in candidates]
+
+    # 2. Score chunks in passes, dropping questions that already have a confident answer
+    best = [None] * len(questions)
+    for first, last in ((0, 1), (1, None)):
+        work = [
+            (index, doc)
+            for index, docs in enumerate(candidates)
+            if best[index] is None or best[index]["score"] < EARLY_STOP_SCORE
+            for doc in docs[first:last]
+        ]
+        answers = run_qa([{"question": questions[index][0], "context": doc.page_content} for index, doc in work])
+        for (index, doc), answer in zip(work, answers):
+            if best[index] is None or answer["score"] > best[index]["score"]:
+                best[index] = {
+                    "answer": answer["answer"],
+                    "score": answer["score"],
+                    "source": doc.metadata.get("source", "Unknown"),
+                    "path": paths[index],
+                }
+    return best
+
+class AskBatcher:
+    """
+    Queues questions from concurrent requests and answers them in batches on a
+    worker thread. While one batch runs, new questions queue up for the next.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def ask(self, query: str, top_k: int):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Callers that already gave up need no answer
+            batch = [item for item in batch if not item[2].done()]
+            if batch:
+                await self._answer(batch)
+
+    async def _answer(self, batch: list):
+        started = time.perf_counter()
+        for _, _, _, queued_at in batch:
+            BATCH_WAIT.observe(started - queued_at)
+        BATCH_SIZE.observe(len(batch))
+        try:
+            results = await asyncio.to_thread(answer_batch, vector_store, lexical_index, [(query, top_k) for query, top_k, _, _ in batch])
+        except Exception as e:
+            print(f"--- ERROR: Failed to answer a batch of {len(batch)} question(s): {e} ---")
+            results = [e] * len(batch)
+        BATCH_DURATION.observe(time.perf_counter() - started)
+        for (_, _, future, _), result in zip(batch, results):
+            if not future.done():
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+ask_batcher = AskBatcher(ASK_MAX_BATCH, ASK_MAX_WAIT_MS / 1000.0)
 
 
 # --- API Endpoints ---
@@ -64,31 +571,47 @@ class QAResponse(BaseModel):
     answer: str
     score: float
     source: str
+    path: str # Which retrieval path served it: alert_name, lexical or hybrid
 
 @app.post("/ask", response_model=QAResponse)
-def ask(request: QARequest):
+async def ask(request: QARequest):
     """
     Accepts a question, finds relevant documents, and extracts an answer.
+    The work is batched with other questions arriving at the same time.
     """
     if not qa_pipeline or not vector_store:
-        return {"error": "Models not loaded yet"}, 503
+        raise HTTPException(status_code=503, detail="Models not loaded yet")
 
-    # 1. Retrieve relevant documents from the vector store
-    retriever = vector_store.as_retriever(search_kwargs={"k": request.top_k})
-    docs = retriever.get_relevant_documents(request.query)
+    result = await ask_batcher.ask(request.query, max(1, request.top_k))
+    if result is None:
+        raise HTTPException(status_code=404, detail="No runbooks are indexed")
+    return result
 
-    # 2. Concatenate the context from the retrieved documents
-    context = " ".join([doc.page_content for doc in docs])
+@app.post("/reindex")
+def reindex_runbooks():
+    """Picks up runbook additions, edits and deletions now instead of waiting for the watcher."""
+    if embeddings is None:
+        raise HTTPException(status_code=503, detail="Models not loaded yet")
+    return reindex()
 
-    # 3. Use the QA pipeline to find the answer within the context
-    result = qa_pipeline(question=request.query, context=context)
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-    return {
-        "answer": result['answer'],
-        "score": result['score'],
-        "source": docs[0].metadata.get('source', 'Unknown') # Return the top source
+def answers_version() -> str:
+    """Changes whenever answers can: a runbook edit, a reindex, or a different model or backend. Caches key on it."""
+    state = {
+        "settings": index_settings(),
+        "qa_model": QA_MODEL,
+        "backend": INFERENCE_BACKEND,
+        "runbooks": {path: entry["sha256"] for path, entry in manifest.items()},
     }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()[:16]
 
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok" if qa_pipeline and vector_store else "loading"}
\ No newline at end of file
+    return {
+        "status": "ok" if qa_pipeline and vector_store else "loading",
+        "backend": INFERENCE_BACKEND,
+        "answers_version": answers_version(),
+    }
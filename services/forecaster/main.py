@@ -1,48 +1,459 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, conlist
+import os
+import time
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict
+from statistics import NormalDist
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, conlist, confloat
+import numpy as np
 import torch
 from chronos import ChronosPipeline
-from typing import List
+from typing import Dict, List, Literal, Optional, Union
 
 app = FastAPI(title="Time-Series Forecasting Service")
 
-# --- Model Loading ---
-print("--- Loading Chronos-T5 forecasting pipeline... ---")
-pipeline = ChronosPipeline.from_pretrained(
-  "amazon/chronos-t5-small",
-  device_map="cuda",
-  torch_dtype=torch.bfloat16,
+# --- Device Settings ---
+# FORECAST_DEVICE is auto (CUDA when available), cuda or cpu. CUDA runs
+# bfloat16; CPUs run float32, as few of them have fast bfloat16 kernels.
+FORECAST_MODEL = os.getenv("FORECAST_MODEL", "amazon/chronos-t5-small")
+DEVICE = os.getenv("FORECAST_DEVICE", "auto")
+if DEVICE == "auto":
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DTYPE = getattr(torch, os.getenv("FORECAST_DTYPE", "bfloat16" if DEVICE == "cuda" else "float32"))
+# Load and warm the model in the background at startup; /healthz reports ready
+# once done. Set to 0 to load it on the first Chronos forecast instead.
+FORECAST_WARMUP = os.getenv("FORECAST_WARMUP", "1") == "1"
+# The warmup forecasts a series as long as the orchestrator's (one hour of 60s steps)
+WARMUP_HISTORY_LENGTH = 60
+
+# --- Batch Settings ---
+# Series per Chronos call in /forecast/batch; GPUs take far larger batches than CPUs
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "64" if DEVICE == "cuda" else "8"))
+# Sample paths drawn per series to estimate the quantiles
+FORECAST_NUM_SAMPLES = int(os.getenv("FORECAST_NUM_SAMPLES", "20"))
+
+# --- Screen Settings ---
+# Every series is first fitted with Holt's linear-trend smoothing (NumPy,
+# vectorized over series and parameter grid). Chronos only runs when the
+# screen's upper band comes near the caller's threshold or the band is too wide
+# to trust; everything else is answered by the screen.
+FORECAST_TIER = os.getenv("FORECAST_TIER", "auto")  # auto, statistical or chronos
+# Smoothing parameters tried per series; the pair with the lowest one-step error wins
+SCREEN_ALPHAS = [float(a) for a in os.getenv("FORECAST_SCREEN_ALPHAS", "0.2,0.4,0.6,0.8").split(",")]
+SCREEN_BETAS = [float(b) for b in os.getenv("FORECAST_SCREEN_BETAS", "0.05,0.2").split(",")]
+# Shorter histories go straight to Chronos; there is too little to fit a trend on
+SCREEN_MIN_HISTORY = int(os.getenv("FORECAST_SCREEN_MIN_HISTORY", "12"))
+# Upper band quantile compared against the threshold
+SCREEN_BAND_LEVEL = float(os.getenv("FORECAST_SCREEN_BAND_LEVEL", "0.95"))
+# Escalate when the upper band reaches within this fraction of the threshold
+SCREEN_THRESHOLD_MARGIN = float(os.getenv("FORECAST_SCREEN_THRESHOLD_MARGIN", "0.2"))
+# Escalate when the band half-width at the horizon exceeds this fraction of the series' typical level
+SCREEN_MAX_SPREAD = float(os.getenv("FORECAST_SCREEN_MAX_SPREAD", "0.5"))
+
+# --- Cache Settings ---
+# Chronos forecasts are cached per series, keyed by the model, a hash of the
+# history and the forecast settings. 0 disables the cache.
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "60"))
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "4096"))
+FORECAST_CACHE_MAX_BYTES = int(os.getenv("FORECAST_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# --- Metrics ---
+COLD_START = Gauge("forecaster_cold_start_seconds", "Time spent bringing the model up (by phase: load, warmup)", ["phase"])
+FORECAST_DURATION = Histogram(
+    "forecaster_request_duration_seconds", "Time to answer a forecast request", ["endpoint"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
 )
-print("--- Forecasting pipeline loaded successfully. ---")
+TIER_ANSWERS = Counter("forecaster_tier_answers_total", "Series answered (by tier and reason)", ["tier", "reason"])
+CACHE_REQUESTS = Counter("forecaster_cache_requests_total", "Chronos forecast lookups (by result: hit, miss, bypass)", ["result"])
+CACHE_ENTRIES = Gauge("forecaster_cache_entries", "Forecasts held in the cache")
+CACHE_BYTES = Gauge("forecaster_cache_bytes", "Approximate forecast bytes held in the cache")
+
+
+# --- Model Loading ---
+pipeline = None
+pipeline_lock = threading.Lock()
+ready = threading.Event()
+cold_start = {}
+warmup_error = None
+
+def load_pipeline():
+    """Returns the Chronos pipeline, loading it on first use; concurrent callers wait for the one load."""
+    global pipeline
+    with pipeline_lock:
+        if pipeline is None:
+            print(f"--- Loading {FORECAST_MODEL} on {DEVICE} ({str(DTYPE).replace('torch.', '')})... ---")
+            started = time.perf_counter()
+            pipeline = ChronosPipeline.from_pretrained(
+                FORECAST_MODEL,
+                device_map=DEVICE,
+                torch_dtype=DTYPE,
+            )
+            cold_start["load_s"] = round(time.perf_counter() - started, 2)
+            COLD_START.labels(phase="load").set(cold_start["load_s"])
+            print(f"--- Forecasting pipeline loaded in {cold_start['load_s']}s ---")
+    return pipeline
+
+def warm_up():
+    """Loads the model and runs both Chronos code paths once, so the first real request is not the slow one."""
+    global warmup_error
+    try:
+        model = load_pipeline()
+        started = time.perf_counter()
+        history = torch.linspace(0.1, 0.2, WARMUP_HISTORY_LENGTH)
+        model.predict(history, 12, num_samples=1)
+        model.predict_quantiles([history] * FORECAST_BATCH_SIZE, 12, quantile_levels=[0.1, 0.5, 0.9], num_samples=FORECAST_NUM_SAMPLES)
+    except Exception as e:
+        # Leave ready unset so /healthz keeps failing, but say why instead of "loading" forever.
+        warmup_error = f"{type(e).__name__}: {e}"
+        print(f"--- ERROR: Forecaster warmup failed: {warmup_error} ---")
+        traceback.print_exc()
+        return
+    cold_start["warmup_s"] = round(time.perf_counter() - started, 2)
+    COLD_START.labels(phase="warmup").set(cold_start["warmup_s"])
+    ready.set()
+    print(f"--- Forecaster warmed up in {cold_start['warmup_s']}s ---")
+
+@app.on_event("startup")
+def start_warmup():
+    if FORECAST_WARMUP:
+        threading.Thread(target=warm_up, daemon=True).start()
+    else:
+        ready.set()
+
+
+# --- Forecast Cache ---
+class ForecastCache:
+    """
+    LRU cache of Chronos forecasts, bounded by entry count and approximate
+    size, with a TTL. Endpoints run in FastAPI's thread pool, hence the lock.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_REQUESTS.labels(result="hit").inc()
+            return entry["value"]
+
+    def put(self, key: tuple, value, floats: int):
+        size = floats * 8
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {"value": value, "bytes": size, "expires_at": time.monotonic() + self.ttl}
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            CACHE_ENTRIES.set(len(self._entries))
+            CACHE_BYTES.set(self._bytes)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+    def _remove(self, key: tuple):
+        self._bytes -= self._entries.pop(key)["bytes"]
+
+forecast_cache = ForecastCache(FORECAST_CACHE_MAX_ENTRIES, FORECAST_CACHE_MAX_BYTES, FORECAST_CACHE_TTL)
+
+def cache_key(kind: str, history: List[float], prediction_length: int, *settings) -> tuple:
+    digest = hashlib.sha256(np.asarray(history, dtype=np.float64).tobytes()).hexdigest()
+    return (FORECAST_MODEL, kind, digest, prediction_length, *settings)
+
+def cached(key: tuple, revalidate: bool):
+    """Cache lookup that counts Cache-Control: no-cache requests as bypasses."""
+    if FORECAST_CACHE_TTL <= 0 or revalidate:
+        CACHE_REQUESTS.labels(result="bypass").inc()
+        return None
+    return forecast_cache.get(key)
 
 
 # --- API Models ---
+Tier = Literal["auto", "statistical", "chronos"]
+
 class ForecastRequest(BaseModel):
     history: conlist(float, min_length=1)
     prediction_length: int = 12
+    # Upper limit the caller cares about (e.g. a latency SLO); forecasts whose band nears it go to Chronos
+    threshold: Optional[float] = None
+    tier: Optional[Tier] = None
 
 class ForecastResponse(BaseModel):
-    forecast: List[float]
+    forecast: List[List[float]]
+    tier: str
+    reason: str
+    cached: bool = False
+
+class NamedSeries(BaseModel):
+    name: str
+    history: conlist(float, min_length=1)
+    threshold: Optional[float] = None
+
+class BatchForecastRequest(BaseModel):
+    series: conlist(NamedSeries, min_length=1)
+    prediction_length: int = 12
+    quantile_levels: List[confloat(gt=0, lt=1)] = [0.1, 0.5, 0.9]
+    # Applies to every series that does not set its own
+    threshold: Optional[float] = None
+    tier: Optional[Tier] = None
+
+class SeriesForecast(BaseModel):
+    name: str
+    mean: List[float]
+    quantiles: Dict[str, List[float]]
+    tier: str
+    reason: str
+
+class BatchForecastResponse(BaseModel):
+    forecasts: List[SeriesForecast]
+    stats: Dict[str, Union[int, float]]
+
+
+# --- Statistical Screen ---
+def holt_screen(histories: List[List[float]], prediction_length: int) -> dict:
+    """
+    Fits Holt's linear-trend smoothing to every history at once. Series are
+    right-aligned in one NaN-padded matrix and each time step updates all
+    (alpha, beta, series) states together, so the Python loop is over time
+    only. Returns per-series mean forecasts, the h-step residual std of the
+    best-fitting parameters, and the typical level used to judge band width.
+    """
+    lengths = np.array([len(h) for h in histories])
+    width = int(lengths.max())
+    y = np.full((len(histories), width), np.nan)
+    for i, history in enumerate(histories):
+        y[i, width - len(history):] = history
+    first = width - lengths
+    rows = np.arange(len(histories))
+
+    alpha, beta = (grid.reshape(-1, 1) for grid in np.meshgrid(SCREEN_ALPHAS, SCREEN_BETAS))
+    second = y[rows, np.minimum(first + 1, width - 1)]
+    level = np.broadcast_to(second, (len(alpha), len(histories))).copy()
+    trend = np.broadcast_to(second - y[rows, first], level.shape).copy()
+    sse = np.zeros_like(level)
+
+    # The first two points seed level and trend; fitting starts at the third
+    for t in range(width):
+        active = t >= first + 2
+        if not active.any():
+            continue
+        observed = y[:, t]
+        predicted = level + trend
+        error = np.where(active, observed - predicted, 0.0)
+        new_level = alpha * observed + (1 - alpha) * predicted
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        sse += error ** 2
+
+    best = sse.argmin(axis=0)
+    level, trend, sse = level[best, rows], trend[best, rows], sse[best, rows]
+    best_alpha, best_beta = alpha[best, 0], beta[best, 0]
+
+    steps = np.arange(1, prediction_length + 1)
+    mean = level[:, None] + steps[None, :] * trend[:, None]
+    # Holt's h-step forecast variance: sigma^2 * (1 + sum_{j<h} alpha^2 (1 + j*beta)^2)
+    weights = (best_alpha[:, None] * (1 + steps[None, :-1] * best_beta[:, None])) ** 2
+    growth = np.concatenate([np.ones((len(histories), 1)), 1 + np.cumsum(weights, axis=1)], axis=1)
+    sigma = np.sqrt(sse / np.maximum(lengths - 2, 1))
+    return {
+        "mean": mean,
+        "std": sigma[:, None] * np.sqrt(growth),
+        "scale": np.nanmean(np.abs(y), axis=1),
+        "lengths": lengths,
+    }
+
+
+def screen_decisions(screen: dict, thresholds: List[Optional[float]]) -> List[str]:
+    """Per series: 'clear' if the screen can answer, else why it escalates to Chronos."""
+    upper = screen["mean"] + NormalDist().inv_cdf(SCREEN_BAND_LEVEL) * screen["std"]
+    spread = (upper[:, -1] - screen["mean"][:, -1]) / np.maximum(screen["scale"], 1e-9)
+    decisions = []
+    for i, threshold in enumerate(thresholds):
+        if screen["lengths"][i] < SCREEN_MIN_HISTORY:
+            decisions.append("short_history")
+        elif threshold is not None and upper[i].max() >= threshold * (1 - SCREEN_THRESHOLD_MARGIN):
+            decisions.append("near_threshold")
+        elif spread[i] > SCREEN_MAX_SPREAD:
+            decisions.append("uncertain")
+        else:
+            decisions.append("clear")
+    return decisions
+
+
+def plan_tiers(histories: List[List[float]], thresholds: List[Optional[float]], prediction_length: int, tier: Optional[str]):
+    """Runs the screen and returns it with the (tier, reason) that answers each series."""
+    tier = tier or FORECAST_TIER
+    if tier == "chronos":
+        return None, [("chronos", "requested")] * len(histories)
+    screen = holt_screen(histories, prediction_length)
+    if tier == "statistical":
+        return screen, [("statistical", "requested")] * len(histories)
+    return screen, [
+        ("statistical", decision) if decision == "clear" else ("chronos", decision)
+        for decision in screen_decisions(screen, thresholds)
+    ]
 
 
 # --- API Endpoints ---
-@app.post("/forecast")
-def forecast_endpoint(request: ForecastRequest):
+@app.post("/forecast", response_model=ForecastResponse)
+def forecast_endpoint(request: ForecastRequest, cache_control: Optional[str] = Header(None)):
+    """
+    Accepts historical time-series data and returns a forecast, from the
+    statistical screen when it is confident and far from the threshold,
+    otherwise from Chronos (or the cache of recent Chronos forecasts).
+    """
+    started = time.perf_counter()
+    screen, [(tier, reason)] = plan_tiers([request.history], [request.threshold], request.prediction_length, request.tier)
+    TIER_ANSWERS.labels(tier=tier, reason=reason).inc()
+
+    hit = False
+    if tier == "statistical":
+        forecast_values = screen["mean"].tolist()
+    else:
+        key = cache_key("predict", request.history, request.prediction_length)
+        forecast_values = cached(key, "no-cache" in (cache_control or ""))
+        hit = forecast_values is not None
+        if not hit:
+            context = torch.tensor(request.history)
+            forecast_tensor = load_pipeline().predict(
+                context,
+                request.prediction_length,
+                num_samples=1,
+            )
+            forecast_values = forecast_tensor.squeeze(0).tolist()
+            forecast_cache.put(key, forecast_values, request.prediction_length)
+    FORECAST_DURATION.labels(endpoint="forecast").observe(time.perf_counter() - started)
+    return {"forecast": forecast_values, "tier": tier, "reason": reason, "cached": hit}
+
+
+@app.post("/forecast/batch", response_model=BatchForecastResponse)
+def forecast_batch_endpoint(request: BatchForecastRequest, cache_control: Optional[str] = Header(None)):
     """
-    Accepts historical time-series data and returns a forecast.
+    Forecasts many named series of any length in one call. All series are
+    screened together; the ones escalated to Chronos are sorted by length and
+    run FORECAST_BATCH_SIZE at a time, so each batch pads as little as
+    possible. Series forecast recently with the same settings come from the
+    cache instead. Results come back in request order.
     """
-    context = torch.tensor(request.history)
+    started = time.perf_counter()
+    levels = sorted(set(request.quantile_levels))
+    forecasts = [None] * len(request.series)
+    batches = 0
 
-    forecast_tensor = pipeline.predict(
-        context,
+    screen, tiers = plan_tiers(
+        [series.history for series in request.series],
+        [request.threshold if series.threshold is None else series.threshold for series in request.series],
         request.prediction_length,
-        num_samples=1,
+        request.tier,
+    )
+    z = {level: NormalDist().inv_cdf(level) for level in levels}
+    revalidate = "no-cache" in (cache_control or "")
+    keys, cache_hits = {}, 0
+    for i, (tier, reason) in enumerate(tiers):
+        TIER_ANSWERS.labels(tier=tier, reason=reason).inc()
+        if tier == "chronos":
+            keys[i] = cache_key("quantiles", request.series[i].history, request.prediction_length, tuple(levels), FORECAST_NUM_SAMPLES)
+            hit = cached(keys[i], revalidate)
+            if hit is not None:
+                forecasts[i] = {"name": request.series[i].name, **hit, "tier": tier, "reason": reason}
+                cache_hits += 1
+        else:
+            mean, std = screen["mean"][i], screen["std"][i]
+            forecasts[i] = {
+                "name": request.series[i].name,
+                "mean": mean.tolist(),
+                "quantiles": {str(level): (mean + z[level] * std).tolist() for level in levels},
+                "tier": tier,
+                "reason": reason,
+            }
+
+    escalated = [i for i, (tier, _) in enumerate(tiers) if tier == "chronos"]
+    order = sorted((i for i in escalated if forecasts[i] is None), key=lambda i: len(request.series[i].history))
+
+    for start in range(0, len(order), FORECAST_BATCH_SIZE):
+        indices = order[start:start + FORECAST_BATCH_SIZE]
+        # Chronos left-pads a list of 1-D tensors of different lengths itself
+        context = [torch.tensor(request.series[i].history) for i in indices]
+        quantiles, mean = load_pipeline().predict_quantiles(
+            context,
+            request.prediction_length,
+            quantile_levels=levels,
+            num_samples=FORECAST_NUM_SAMPLES,
+        )
+        batches += 1
+        for row, i in enumerate(indices):
+            result = {
+                "mean": mean[row].tolist(),
+                "quantiles": {str(level): quantiles[row, :, q].tolist() for q, level in enumerate(levels)},
+            }
+            forecast_cache.put(keys[i], result, request.prediction_length * (len(levels) + 1))
+            forecasts[i] = {"name": request.series[i].name, **result, "tier": "chronos", "reason": tiers[i][1]}
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "series": len(forecasts),
+        "statistical": len(forecasts) - len(escalated),
+        "chronos": len(escalated),
+        "cache_hits": cache_hits,
+        "batches": batches,
+        "duration_ms": round(elapsed * 1000, 1),
+        "ms_per_series": round(elapsed * 1000 / len(forecasts), 2),
+        "series_per_s": round(len(forecasts) / elapsed, 1) if elapsed else 0.0,
+    }
+    FORECAST_DURATION.labels(endpoint="batch").observe(elapsed)
+    print(
+        f"--- Forecast {stats['series']} series ({stats['statistical']} statistical, {stats['chronos']} chronos, "
+        f"{stats['cache_hits']} cached, {stats['batches']} batch(es)): {stats['duration_ms']}ms, {stats['series_per_s']} series/s ---"
     )
+    return {"forecasts": forecasts, "stats": stats}
 
-    forecast_values = forecast_tensor.squeeze(0).tolist()
-    return {"forecast": forecast_values}
 
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok"}
\ No newline at end of file
+    """503 until the model is loaded and warmed, so the compose healthcheck waits for it; 'failed' if warmup raised."""
+    health = {
+        "status": "ok" if ready.is_set() else "failed" if warmup_error else "loading",
+        "device": DEVICE,
+        "dtype": str(DTYPE).replace("torch.", ""),
+        "model": FORECAST_MODEL,
+        "cold_start": cold_start,
+        "cache": forecast_cache.stats(),
+    }
+    if warmup_error and not ready.is_set():
+        health["error"] = warmup_error
+    return health if ready.is_set() else JSONResponse(health, status_code=503)
\ No newline at end of file
@@ -1,14 +1,29 @@
 import os
 import time
+import asyncio
 import httpx
 import json
+import asyncpg
 import re
-from fastapi import FastAPI, Request
-from sqlalchemy import create_engine, text, insert, select
+import struct
+import yaml
+import cramjam
+import numpy as np
+from contextlib import contextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import text, insert, select, update, delete, func, and_
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.schema import Table, MetaData
-from slack_sdk.webhook import WebhookClient
-from github import Github
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
 import uuid
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
 
 # --- Configuration ---
 DB_USER = os.getenv("POSTGRES_USER", "user")
@@ -16,21 +31,175 @@ DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 DB_NAME = os.getenv("POSTGRES_DB", "opsseer")
 DB_HOST = "postgres"
 DB_PORT = "5432"
-AI_GATEWAY_URL = "http://ai-gateway:8000"
+AI_GATEWAY_URL = os.getenv("AI_GATEWAY_URL", "http://ai-gateway:8000")
+# Incident enrichment is admitted ahead of interactive and batch traffic at the gateway
+GATEWAY_HEADERS = {"X-Priority": "incident"}
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_REPO = os.getenv("GITHUB_REPO")
-GRAFANA_URL = "http://grafana:3000"
-PROMETHEUS_URL = "http://prometheus:9090"
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GRAFANA_URL = os.getenv("GRAFANA_URL", "http://grafana:3000")
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus:9090")
 LATENCY_SLO = 0.300 # 300ms
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
+# Per-stage deadlines (seconds). Enrichment stages run concurrently, so a slow
+# renderer or a cold GPU model only ever costs its own stage.
+STAGE_TIMEOUTS = {
+    "docqa": float(os.getenv("DOCQA_STAGE_TIMEOUT", "60")),
+    "vision": float(os.getenv("VISION_STAGE_TIMEOUT", "45")),
+    "forecast": float(os.getenv("FORECAST_STAGE_TIMEOUT", "60")),
+}
+
+# Alert job queue. The webhook only persists jobs; a fixed pool of workers
+# drains them, which bounds how many alerts are enriched at once.
+ALERT_JOB_WORKERS = int(os.getenv("ALERT_JOB_WORKERS", "4"))
+ALERT_JOB_MAX_ATTEMPTS = int(os.getenv("ALERT_JOB_MAX_ATTEMPTS", "3"))
+ALERT_JOB_POLL_INTERVAL = float(os.getenv("ALERT_JOB_POLL_INTERVAL", "2.0"))
+ALERT_JOB_LEASE_SECONDS = float(os.getenv("ALERT_JOB_LEASE_SECONDS", "300"))
+
+# Timeline events are buffered and group-committed by a single writer task.
+TIMELINE_FLUSH_INTERVAL = float(os.getenv("TIMELINE_FLUSH_INTERVAL", "0.05"))
+TIMELINE_MAX_BATCH = int(os.getenv("TIMELINE_MAX_BATCH", "200"))
+TIMELINE_RETRY_MAX_BACKOFF = float(os.getenv("TIMELINE_RETRY_MAX_BACKOFF", "5.0"))
+# Number of incidents whose latest event ID is remembered for ETag checks.
+TIMELINE_VERSION_CACHE_SIZE = int(os.getenv("TIMELINE_VERSION_CACHE_SIZE", "10000"))
+
+# Live timeline stream (SSE), fed by the timeline_events NOTIFY channel from init.sql.
+TIMELINE_CHANNEL = "timeline_events"
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+SSE_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SSE_SUBSCRIBER_QUEUE_SIZE", "1000"))
+
+# Repeats of an open alert (same fingerprint) are folded into its incident instead
+# of being enriched again, unless nothing was heard from it for this long.
+INCIDENT_MAX_IDLE_SECONDS = float(os.getenv("INCIDENT_MAX_IDLE_SECONDS", str(24 * 60 * 60)))
+
+# Rolling SLO series, fed by Prometheus remote-write (POST /api/v1/write) and
+# backfilled with query_range on startup, so forecasts need no Prometheus round trip.
+# Each series is a fixed ring of SERIES_STORE_POINTS slots, one per minute.
+SERIES_STORE_METRICS = [name.strip() for name in os.getenv("SERIES_STORE_METRICS", "toyprod:p95_latency_seconds:5m").split(",") if name.strip()]
+SERIES_STORE_STEP = 60 # the step forecast_stage asks query_range for
+SERIES_STORE_POINTS = int(os.getenv("SERIES_STORE_POINTS", "240"))
+SERIES_STORE_MAX_SERIES = int(os.getenv("SERIES_STORE_MAX_SERIES", "512"))
+# Below this share of filled slots in the requested window, fall back to query_range
+SERIES_STORE_MIN_COVERAGE = float(os.getenv("SERIES_STORE_MIN_COVERAGE", "0.9"))
+FORECAST_QUERY = "toyprod:p95_latency_seconds:5m"
+FORECAST_HISTORY_SECONDS = 60 * 60 # 1 hour of history
+
+# Proactive forecast scan. Every FORECAST_SCAN_INTERVAL seconds (0 disables) all
+# series of the metrics below are fetched with one query_range, forecast through
+# the forecaster's batch endpoint, and a predicted breach of the metric's
+# threshold opens a PredictedSLOBreach incident. Thresholds mirror rules*.yml.
+FORECAST_SCAN_INTERVAL = float(os.getenv("FORECAST_SCAN_INTERVAL", "300"))
+FORECAST_SCAN_THRESHOLDS = {
+    name.strip(): float(threshold)
+    for name, threshold in (
+        item.split("=") for item in os.getenv(
+            "FORECAST_SCAN_THRESHOLDS",
+            "toyprod:p95_latency_seconds:5m=0.3,toyprod:error_rate:ratio_5m=0.1,svc:mem_usage:percent=95,svc:cpu_usage:percent=90",
+        ).split(",") if item.strip()
+    )
+}
+FORECAST_SCAN_HORIZON = int(os.getenv("FORECAST_SCAN_HORIZON", "15")) # steps of 60s ahead
+# Series per forecaster call; batches go out concurrently
+FORECAST_SCAN_BATCH = int(os.getenv("FORECAST_SCAN_BATCH", "256"))
+
+# Rendered Grafana panels. Alerts within the same RENDER_CACHE_TTL-second bucket
+# share one render; at most RENDER_CONCURRENCY renders run at once. Every PNG is
+# kept in a content-addressed store under ARTIFACT_DIR, oldest evicted first once
+# it holds more than ARTIFACT_MAX_BYTES, and timeline events reference it by hash.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "/data/artifacts")
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL", "30"))
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", "2"))
+
+# Outbound notifications. Each destination sends at most once per interval; incidents
+# that queue up in the meantime go out together as one digest.
+SLACK_MIN_INTERVAL = float(os.getenv("SLACK_MIN_INTERVAL", "1.0"))
+GITHUB_MIN_INTERVAL = float(os.getenv("GITHUB_MIN_INTERVAL", "2.0"))
+NOTIFY_DIGEST_MAX = int(os.getenv("NOTIFY_DIGEST_MAX", "10"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "1.0"))
+GITHUB_TITLE_MAX = 256
+
+DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+engine = create_async_engine(DATABASE_URL, pool_size=ALERT_JOB_WORKERS + 2)
 metadata = MetaData()
-timeline_table = Table("timeline", metadata, autoload_with=engine)
+
+# Mirrors infra/postgres/init.sql
+timeline_table = Table(
+    "timeline", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("incident_id", String(255), nullable=False),
+    Column("event_ts", DateTime(timezone=True), nullable=False),
+    Column("type", String(50), nullable=False),
+    Column("payload", JSONB),
+)
+alert_jobs_table = Table(
+    "alert_jobs", metadata,
+    Column("id", BigInteger, primary_key=True),
+    Column("incident_id", String(255), nullable=False),
+    Column("kind", String(20), nullable=False),
+    Column("status", String(20), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("alert", JSONB, nullable=False),
+    Column("last_error", Text),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+incidents_table = Table(
+    "incidents", metadata,
+    Column("incident_id", String(255), primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("alertname", String(255)),
+    Column("status", String(20), nullable=False),
+    Column("opened_at", DateTime(timezone=True), nullable=False),
+    Column("last_seen_at", DateTime(timezone=True), nullable=False),
+    Column("resolved_at", DateTime(timezone=True)),
+)
 
 app = FastAPI(title="Orchestrator")
 
+# --- Metrics ---
+STAGE_LATENCY = Histogram(
+    "orchestrator_stage_duration_seconds", "Incident pipeline stage latency (seconds)", ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+INCIDENTS = Counter("orchestrator_incidents_total", "Alert jobs processed (by kind: new, repeat, resolve)", ["kind"])
+FAILURES = Counter("orchestrator_failures_total", "Incident pipeline failures (by stage)", ["stage"])
+TIMELINE_EVENTS_WRITTEN = Counter("orchestrator_timeline_events_written_total", "Timeline events committed to Postgres")
+TIMELINE_EVENTS_DROPPED = Counter("orchestrator_timeline_events_dropped_total", "Timeline events dropped because Postgres rejected their data")
+ALERTS_IN_FLIGHT = Gauge("orchestrator_alerts_in_flight", "Alert jobs currently being processed")
+JOB_QUEUE_DEPTH = Gauge("orchestrator_job_queue_depth", "Alert jobs in the queue (by status)", ["status"])
+JOB_OLDEST_AGE = Gauge("orchestrator_job_oldest_age_seconds", "Age of the oldest alert job (by status)", ["status"])
+SERIES_SAMPLES = Counter("orchestrator_series_samples_total", "Samples offered to the SLO series store (by result: stored, expired, ignored, overflow)", ["result"])
+SERIES_COUNT = Gauge("orchestrator_series_store_series", "Series held in the SLO series store")
+SERIES_BYTES = Gauge("orchestrator_series_store_bytes", "Ring buffer bytes held by the SLO series store")
+SCAN_DURATION = Histogram(
+    "orchestrator_forecast_scan_duration_seconds", "Time for one proactive forecast scan",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SCAN_SERIES = Gauge("orchestrator_forecast_scan_series", "Series forecast by the last proactive scan")
+PREDICTED_BREACHES = Counter("orchestrator_predicted_breaches_total", "Predicted threshold breaches found by the proactive scan (by metric)", ["metric"])
+RENDER_REQUESTS = Counter("orchestrator_render_requests_total", "Grafana panel captures (by result: hit, miss, coalesced)", ["result"])
+RENDER_QUEUE_WAIT = Histogram(
+    "orchestrator_render_queue_wait_seconds", "Time a render waited for a renderer slot",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ARTIFACT_BYTES = Gauge("orchestrator_artifact_store_bytes", "Bytes held in the panel artifact store")
+ARTIFACT_EVICTIONS = Counter("orchestrator_artifact_evictions_total", "Artifacts evicted from the store to stay under ARTIFACT_MAX_BYTES")
+HISTORY_SOURCE = Counter("orchestrator_forecast_history_total", "Forecast histories served (by source: series_store, query_range)", ["source"])
+
+@contextmanager
+def observe_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        FAILURES.labels(stage=stage).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - started)
+
 # (CORS Middleware remains the same)
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
@@ -39,73 +208,830 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# --- Timeline Writer ---
+class TimelineVersions:
+    """
+    Bounded LRU map of incident ID -> highest committed timeline event ID.
+    It lets /timeline answer If-None-Match without a database round trip.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._versions = OrderedDict()
+
+    def get(self, incident_id: str):
+        version = self._versions.get(incident_id)
+        if version is not None:
+            self._versions.move_to_end(incident_id)
+        return version
+
+    def advance(self, incident_id: str, event_id: int):
+        # Never move backwards: a reader may report a max ID that a concurrent flush has already passed.
+        self._versions[incident_id] = max(event_id, self._versions.get(incident_id, 0))
+        self._versions.move_to_end(incident_id)
+        while len(self._versions) > self.max_size:
+            self._versions.popitem(last=False)
+
+timeline_versions = TimelineVersions(TIMELINE_VERSION_CACHE_SIZE)
+
+class TimelineWriter:
+    """
+    Buffers timeline events from all incidents and commits them with one
+    multi-row INSERT per flush, either every flush_interval seconds or as soon
+    as max_batch events are waiting. Callers never wait on the database.
+    A batch that Postgres rejects for its data is written row by row, and
+    only the rows that are still rejected are logged and dropped. Any other
+    failure (an outage) keeps every unwritten event and its flush() waiters
+    and retries with exponential backoff.
+    """
+
+    def __init__(self, flush_interval: float, max_batch: int, max_backoff: float):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._pending = []
+        self._waiters = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def add(self, incident_id: str, event_type: str, payload: dict):
+        # Stamp the event now; a shared NOW() at commit time would collapse the ordering of a batch.
+        self._pending.append({
+            "incident_id": incident_id,
+            "type": event_type,
+            "payload": payload,
+            "event_ts": datetime.now(timezone.utc),
+        })
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Returns once every event added before this call has been committed."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        await waiter
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"--- ERROR: Dropping {len(self._pending)} unflushed timeline event(s) on shutdown ---")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._write_pending()
+
+    async def _write_pending(self):
+        batch, self._pending = self._pending, []
+        waiters, self._waiters = self._waiters, []
+        written, done = [], 0
+        try:
+            if batch:
+                with observe_stage("db_insert"):
+                    try:
+                        rows = []
+                        async with engine.begin() as connection:
+                            for i in range(0, len(batch), self.max_batch):
+                                rows.extend((await connection.execute(self._insert(batch[i:i + self.max_batch]))).fetchall())
+                        written, done = rows, len(batch)
+                    except Exception as e:
+                        if not is_data_error(e):
+                            raise
+                        print(f"--- ERROR: Postgres rejected a batch of {len(batch)} timeline event(s), writing them one by one: {e} ---")
+                        # One transaction per event, so only the events that cannot be written are lost
+                        for row in batch:
+                            try:
+                                async with engine.begin() as connection:
+                                    written.extend((await connection.execute(self._insert([row]))).fetchall())
+                            except Exception as e:
+                                if not is_data_error(e):
+                                    raise
+                                TIMELINE_EVENTS_DROPPED.inc()
+                                print(f"--- ERROR: Dropping {row['type']} timeline event for incident {row['incident_id']}: {e} ---")
+                            done += 1
+        except Exception as e:
+            # Keep the unwritten events, and everyone waiting on them, for the next attempt.
+            self._failures += 1
+            delay = min(self.flush_interval * 2 ** self._failures, self.max_backoff)
+            print(f"--- ERROR: Failed to write {len(batch) - done} timeline event(s) (attempt {self._failures}), retrying in {delay:.2f}s: {e} ---")
+            self._pending = batch[done:] + self._pending
+            self._waiters = waiters + self._waiters
+            self._committed(written)
+            await asyncio.sleep(delay)
+            return
+        self._failures = 0
+
+        self._committed(written)
+        if batch:
+            print(f"--- Flushed {len(written)} timeline event(s) ---")
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @staticmethod
+    def _insert(rows: list):
+        return insert(timeline_table).values(rows).returning(timeline_table.c.id, timeline_table.c.incident_id)
+
+    @staticmethod
+    def _committed(written: list):
+        TIMELINE_EVENTS_WRITTEN.inc(len(written))
+        for row in written:
+            timeline_versions.advance(row.incident_id, row.id)
+
+def is_data_error(e: Exception) -> bool:
+    """True if Postgres (or the driver binding the row) rejected the data itself; retrying the same row cannot succeed."""
+    if isinstance(e, (DataError, IntegrityError)):
+        return True
+    # A StatementError that is not a DBAPIError failed while binding parameters, before reaching the database
+    return isinstance(e, StatementError) and not isinstance(e, DBAPIError)
+
+async def fetch_timeline_events(connection, incident_id: str, since: int = 0) -> list:
+    stmt = (
+        select(timeline_table)
+        .where(and_(timeline_table.c.incident_id == incident_id, timeline_table.c.id > since))
+        .order_by(timeline_table.c.event_ts, timeline_table.c.id)
+    )
+    return [dict(row._mapping) for row in (await connection.execute(stmt)).fetchall()]
+
+# --- Live Timeline Hub ---
+class TimelineHub:
+    """
+    Fans new timeline events out to every SSE subscriber of an incident.
+    A single LISTEN connection hears about inserted rows, and each burst of
+    notifications costs one query per incident no matter how many viewers
+    are attached.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._cursors = {}
+        self._dirty = {}
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def subscribe(self, incident_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(incident_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, incident_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(incident_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[incident_id]
+            self._cursors.pop(incident_id, None)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._dispatch())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        event = json.loads(payload)
+        incident_id = event["incident_id"]
+        if incident_id in self._subscribers:
+            # Remember the lowest unseen ID; the dispatcher reads everything after its cursor anyway.
+            self._dirty[incident_id] = min(event["id"], self._dirty.get(incident_id, event["id"]))
+            self._wakeup.set()
+
+    async def _listen(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(TIMELINE_CHANNEL, self._on_notify)
+                print(f"--- Listening for timeline events on '{TIMELINE_CHANNEL}' ---")
+                # Anything inserted while we were disconnected is picked up from each cursor.
+                for incident_id in self._subscribers:
+                    self._dirty.setdefault(incident_id, self._cursors.get(incident_id, 0) + 1)
+                self._wakeup.set()
+                while True:
+                    await asyncio.sleep(SSE_HEARTBEAT_INTERVAL)
+                    await connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"--- ERROR: Timeline listener connection lost, reconnecting: {e} ---")
+                await asyncio.sleep(1.0)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            dirty, self._dirty = self._dirty, {}
+            for incident_id, first_id in dirty.items():
+                if incident_id not in self._subscribers:
+                    continue
+                cursor = self._cursors.get(incident_id, first_id - 1)
+                try:
+                    async with engine.connect() as connection:
+                        events = await fetch_timeline_events(connection, incident_id, cursor)
+                except Exception as e:
+                    print(f"--- ERROR: Could not read new events for incident {incident_id}: {e} ---")
+                    continue
+                if events:
+                    self._cursors[incident_id] = events[-1]["id"]
+                    self._broadcast(incident_id, events)
+
+    def _broadcast(self, incident_id: str, events: list):
+        for queue in list(self._subscribers.get(incident_id, ())):
+            try:
+                for event in events:
+                    queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow to keep up: close its stream; the browser reconnects with Last-Event-ID.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.unsubscribe(incident_id, queue)
+
+# --- SLO Series Store ---
+def read_varint(buf, pos: int):
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def protobuf_fields(buf):
+    """Yields (field number, value) from one protobuf message: ints for varints, bytes otherwise."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+        yield field, value
+
+def decode_write_request(body: bytes):
+    """
+    Decodes a snappy-compressed remote-write WriteRequest into
+    (labels, timestamps_ms, values) per time series. Only the fields the store
+    needs are read (labels and float samples); exemplars, native histograms
+    and metadata are skipped.
+    """
+    message = memoryview(bytes(cramjam.snappy.decompress_raw(body)))
+    for field, series in protobuf_fields(message):
+        if field != 1:
+            continue
+        labels, timestamps, values = {}, [], []
+        for series_field, value in protobuf_fields(series):
+            if series_field == 1:
+                label = dict(protobuf_fields(value))
+                labels[bytes(label.get(1, b"")).decode()] = bytes(label.get(2, b"")).decode()
+            elif series_field == 2:
+                sample = dict(protobuf_fields(value))
+                values.append(struct.unpack("<d", sample[1])[0] if 1 in sample else 0.0)
+                timestamps.append(sample.get(2, 0))
+        yield labels, timestamps, values
+
+class SeriesRing:
+    """One series: SERIES_STORE_POINTS value slots and the step number each slot currently holds."""
+
+    def __init__(self, metric: str, points: int, labels: dict = None):
+        self.metric = metric
+        self.labels = labels or {}
+        self.values = np.full(points, np.nan)
+        self.slots = np.full(points, -1, dtype=np.int64)
+        self.latest = -1
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.slots.nbytes
+
+class SeriesStore:
+    """
+    Fixed-size ring buffers for a configured set of metrics, keyed by label
+    set. A sample at time t lands in the slot of the first step at or after t,
+    so a slot holds what query_range would return for that step. Memory is
+    bounded by SERIES_STORE_MAX_SERIES rings of SERIES_STORE_POINTS slots.
+    """
+
+    def __init__(self, metrics: list, step: int, points: int, max_series: int):
+        self.metrics = set(metrics)
+        self.step = step
+        self.points = points
+        self.max_series = max_series
+        self._series = OrderedDict()  # label key -> SeriesRing, in arrival order
+
+    def __len__(self):
+        return len(self._series)
+
+    def add(self, labels: dict, timestamps_ms, values):
+        if labels.get("__name__") not in self.metrics:
+            SERIES_SAMPLES.labels(result="ignored").inc(len(values))
+            return
+        key = ",".join(f"{name}={value}" for name, value in sorted(labels.items()))
+        ring = self._series.get(key)
+        if ring is None:
+            if len(self._series) >= self.max_series:
+                SERIES_SAMPLES.labels(result="overflow").inc(len(values))
+                return
+            ring = self._series[key] = SeriesRing(labels["__name__"], self.points, labels)
+            self._update_gauges()
+
+        slots = -(-np.asarray(timestamps_ms, dtype=np.int64) // (self.step * 1000))
+        values = np.asarray(values, dtype=np.float64)
+        latest = max(ring.latest, int(slots.max(initial=-1)))
+        # Anything older than the ring's window would overwrite a newer slot
+        fresh = slots > latest - self.points
+        ring.values[slots[fresh] % self.points] = values[fresh]
+        ring.slots[slots[fresh] % self.points] = slots[fresh]
+        ring.latest = latest
+        SERIES_SAMPLES.labels(result="stored").inc(int(fresh.sum()))
+        SERIES_SAMPLES.labels(result="expired").inc(int((~fresh).sum()))
+
+    def history(self, metric: str, end: int, seconds: int, labels: dict = None):
+        """
+        Values of the one series of `metric` whose labels include `labels`, at
+        each step from end - seconds to end (as query_range would return them),
+        gaps carried forward. None when the store does not cover enough of that
+        window; ValueError when more than one series matches.
+        """
+        labels = labels or {}
+        rings = [
+            ring for ring in self._series.values()
+            if ring.metric == metric and all(ring.labels.get(name) == value for name, value in labels.items())
+        ]
+        if len(rings) > 1:
+            raise ValueError(f"{len(rings)} series of {metric} match {labels or 'no labels'}; narrow the label set")
+        if not rings:
+            return None
+        ring = rings[0]
+        wanted = np.arange((end - seconds) // self.step, end // self.step + 1)
+        index = wanted % self.points
+        values = np.where(ring.slots[index] == wanted, ring.values[index], np.nan)
+        filled = ~np.isnan(values)
+        if filled.mean() < SERIES_STORE_MIN_COVERAGE:
+            return None
+        # Carry the last seen value over gaps, then drop the leading gap
+        last_seen = np.maximum.accumulate(np.where(filled, np.arange(len(values)), -1))
+        values = values[last_seen[last_seen >= 0]]
+        return values.tolist()
+
+    def stats(self) -> dict:
+        return {
+            "metrics": sorted(self.metrics),
+            "step_seconds": self.step,
+            "points_per_series": self.points,
+            "bytes_per_series": SeriesRing("", self.points).nbytes,
+            "max_series": self.max_series,
+            "bytes": sum(ring.nbytes for ring in self._series.values()),
+            "series": {
+                key: {
+                    "filled": int((ring.slots > ring.latest - self.points).sum()),
+                    "latest": datetime.fromtimestamp(ring.latest * self.step, timezone.utc).isoformat() if ring.latest >= 0 else None,
+                }
+                for key, ring in self._series.items()
+            },
+        }
+
+    def _update_gauges(self):
+        SERIES_COUNT.set(len(self._series))
+        SERIES_BYTES.set(sum(ring.nbytes for ring in self._series.values()))
+
+async def check_remote_write_filter(client: httpx.AsyncClient):
+    """
+    Warns about SERIES_STORE_METRICS that Prometheus's remote_write keep rule
+    for this service filters out. The rule lives in ops/prometheus/prometheus.yml,
+    which cannot read our environment, so the two lists must be edited together.
+    """
+    try:
+        response = await client.get(f"{PROMETHEUS_URL}/api/v1/status/config")
+        response.raise_for_status()
+        config = yaml.safe_load(response.json()["data"]["yaml"]) or {}
+    except (httpx.HTTPError, KeyError, ValueError, yaml.YAMLError) as e:
+        print(f"--- WARNING: Could not read the Prometheus config to check remote_write: {e} ---")
+        return
+    targets = [target for target in config.get("remote_write") or [] if target.get("url", "").endswith("/api/v1/write")]
+    if not targets:
+        print("--- WARNING: Prometheus has no remote_write to /api/v1/write; the series store only gets the startup backfill ---")
+        return
+    for target in targets:
+        # Prometheus anchors relabel regexes at both ends
+        keep = [
+            re.compile(f"^(?:{rule.get('regex', '(.*)')})$")
+            for rule in target.get("write_relabel_configs") or []
+            if rule.get("action", "replace") == "keep" and rule.get("source_labels") == ["__name__"]
+        ]
+        dropped = [metric for metric in SERIES_STORE_METRICS if not all(pattern.match(metric) for pattern in keep)]
+        if dropped:
+            print(f"--- WARNING: Prometheus remote_write to {target['url']} does not keep {dropped}; add them to its write_relabel_configs regex ---")
+
+async def backfill_series_store():
+    """Seeds the store from query_range so forecasts work before remote-write has filled a window."""
+    end = int(time.time()) // SERIES_STORE_STEP * SERIES_STORE_STEP
+    start = end - (SERIES_STORE_POINTS - 1) * SERIES_STORE_STEP
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        await check_remote_write_filter(client)
+        for metric in SERIES_STORE_METRICS:
+            try:
+                response = await client.get(
+                    f"{PROMETHEUS_URL}/api/v1/query_range",
+                    params={"query": metric, "start": start, "end": end, "step": f"{SERIES_STORE_STEP}s"},
+                )
+                response.raise_for_status()
+                results = response.json()["data"]["result"]
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                print(f"--- WARNING: Could not backfill {metric} from Prometheus: {e} ---")
+                continue
+            for result in results:
+                samples = np.array(result["values"], dtype=np.float64).reshape(-1, 2)
+                series_store.add(result["metric"] | {"__name__": metric}, (samples[:, 0] * 1000).astype(np.int64), samples[:, 1])
+            print(f"--- Backfilled {len(results)} series of {metric} ({SERIES_STORE_POINTS} steps) ---")
+
+series_store = SeriesStore(SERIES_STORE_METRICS, SERIES_STORE_STEP, SERIES_STORE_POINTS, SERIES_STORE_MAX_SERIES)
+
+timeline_writer = TimelineWriter(TIMELINE_FLUSH_INTERVAL, TIMELINE_MAX_BATCH, TIMELINE_RETRY_MAX_BACKOFF)
+timeline_hub = TimelineHub(SSE_SUBSCRIBER_QUEUE_SIZE)
+job_wakeup = asyncio.Event()
+job_workers = []
+background_tasks = []
+
 @app.on_event("startup")
-def startup_event():
-    # (Startup logic remains the same)
+async def startup_event():
+    timeline_writer.start()
+    timeline_hub.start()
+    notifier.start()
+    try:
+        print(f"--- Artifact store holds {await asyncio.to_thread(artifact_store.load)} panel(s) ---")
+    except OSError as e:
+        print(f"--- WARNING: Could not index the artifact store at {ARTIFACT_DIR}: {e} ---")
+    background_tasks.append(asyncio.create_task(backfill_series_store()))
+    if FORECAST_SCAN_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(forecast_scan_loop()))
     try:
-        with engine.connect() as connection:
-            print("--- Database connection verified, timeline table loaded. ---")
+        requeued = await requeue_interrupted_jobs()
+        print(f"--- Database connection verified, {requeued} interrupted job(s) re-queued. ---")
     except Exception as e:
+        # Workers still reclaim them once their lease (ALERT_JOB_LEASE_SECONDS) runs out
         print(f"FATAL: Could not connect to database on startup: {e}")
+    try:
+        await open_incidents.load()
+        print(f"--- Loaded {len(open_incidents)} open incident(s) into the fingerprint index ---")
+    except Exception as e:
+        print(f"--- ERROR: Could not load open incidents, will retry on the next alert: {e} ---")
+
+    for worker_id in range(ALERT_JOB_WORKERS):
+        job_workers.append(asyncio.create_task(alert_job_worker(worker_id)))
+    print(f"--- Started {ALERT_JOB_WORKERS} alert job worker(s) ---")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Jobs that were mid-flight stay 'running' and are re-queued on the next startup.
+    for task in job_workers + background_tasks:
+        task.cancel()
+    await asyncio.gather(*job_workers, *background_tasks, return_exceptions=True)
+    await timeline_writer.stop()
+    await timeline_hub.stop()
+    await notifier.stop()
+    await engine.dispose()
 
-# (Helper functions add_timeline_event, post_to_slack, create_github_issue, capture_grafana_panel remain the same)
 def add_timeline_event(incident_id: str, event_type: str, payload: dict):
-    with engine.connect() as connection:
-        stmt = insert(timeline_table).values(incident_id=incident_id, type=event_type, payload=payload)
-        connection.execute(stmt)
-        connection.commit()
-    print(f"--- Inserted event '{event_type}' for incident {incident_id} ---")
-
-def post_to_slack(incident_id: str, alert: dict, ai_insight: dict, proactive_warning: str = ""):
-    if not SLACK_WEBHOOK_URL: return
-    webhook = WebhookClient(SLACK_WEBHOOK_URL)
-    summary = alert.get('annotations', {}).get('summary', 'No summary')
-    docqa_answer = ai_insight.get('answer', 'No answer found.')
-    source = ai_insight.get('source', 'Unknown source')
-
-    blocks=[
-        {"type": "header", "text": {"type": "plain_text", "text": f":rotating_light: New Incident: {incident_id}"}},
-        {"type": "section", "fields": [{"type": "mrkdwn", "text": f"*Alert*\n{summary}"}]},
-        {"type": "section", "text": {"type": "mrkdwn", "text": f"*AI Suggested Action*:\n>{docqa_answer}\n\n*Source*: `{source}`"}}
-    ]
+    timeline_writer.add(incident_id, event_type, payload)
+    print(f"--- Queued event '{event_type}' for incident {incident_id} ---")
 
-    if proactive_warning:
-        blocks.append({ "type": "section", "text": { "type": "mrkdwn", "text": f"⚠️ *Proactive Warning*:\n>{proactive_warning}" }})
+# --- Notification Dispatcher ---
+def incident_summary(alert: dict) -> str:
+    return alert.get('annotations', {}).get('summary', 'No summary')
 
-    webhook.send(text=f"New Incident: {summary}", blocks=blocks)
-    print("--- Slack notification sent. ---")
+async def send_to_slack(client: httpx.AsyncClient, batch: list):
+    if len(batch) == 1:
+        item = batch[0]
+        summary = incident_summary(item["alert"])
+        docqa_answer = item["ai_insight"].get('answer', 'No answer found.')
+        source = item["ai_insight"].get('source', 'Unknown source')
+        text = f"New Incident: {summary}"
+        blocks = [
+            {"type": "header", "text": {"type": "plain_text", "text": f":rotating_light: New Incident: {item['incident_id']}"}},
+            {"type": "section", "fields": [{"type": "mrkdwn", "text": f"*Alert*\n{summary}"}]},
+            {"type": "section", "text": {"type": "mrkdwn", "text": f"*AI Suggested Action*:\n>{docqa_answer}\n\n*Source*: `{source}`"}}
+        ]
+    else:
+        text = f"{len(batch)} New Incidents"
+        blocks = [{"type": "header", "text": {"type": "plain_text", "text": f":rotating_light: {len(batch)} New Incidents"}}]
+        for item in batch:
+            docqa_answer = item["ai_insight"].get('answer', 'No answer found.')
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": f"*{incident_summary(item['alert'])}* (`{item['incident_id']}`)\n>{docqa_answer}"}})
+    return await client.post(SLACK_WEBHOOK_URL, json={"text": text, "blocks": blocks})
 
-def create_github_issue(incident_id: str, alert: dict, ai_insight: dict):
-    # ... (code is unchanged)
-    if not GITHUB_TOKEN or not GITHUB_REPO: return
-    try:
-        g = Github(GITHUB_TOKEN)
-        repo = g.get_repo(GITHUB_REPO)
-        summary = alert.get('annotations', {}).get('summary', 'No summary')
+async def send_to_github(client: httpx.AsyncClient, batch: list):
+    sections = []
+    for item in batch:
+        alert, ai_insight = item["alert"], item["ai_insight"]
         description = alert.get('annotations', {}).get('description', 'No description.')
         docqa_answer = ai_insight.get('answer', 'No answer found.')
         source = ai_insight.get('source', 'Unknown source')
-        title = f"Incident {incident_id}: {summary}"
-        body = f"### 🚨 Alert Details\n**Summary:** {summary}\n**Description:** {description}\n---\n### 🤖 AI Suggested Action\n**Suggestion:** {docqa_answer}\n**Source:** `{source}`"
-        repo.create_issue(title=title, body=body.strip(), labels=["incident"])
-        print(f"--- Successfully created GitHub issue in {GITHUB_REPO}. ---")
-    except Exception as e:
-        print(f"--- ERROR: Failed to create GitHub issue: {e} ---")
+        sections.append(f"### 🚨 Alert Details\n**Incident:** `{item['incident_id']}`\n**Summary:** {incident_summary(alert)}\n**Description:** {description}\n---\n### 🤖 AI Suggested Action\n**Suggestion:** {docqa_answer}\n**Source:** `{source}`")
 
-async def capture_grafana_panel(dashboard_uid: str, panel_id: int):
-    # ... (code is unchanged)
+    if len(batch) == 1:
+        title = f"Incident {batch[0]['incident_id']}: {incident_summary(batch[0]['alert'])}"
+    else:
+        # The full list is in the body; GitHub rejects titles over 256 characters
+        summaries = sorted({incident_summary(item['alert']) for item in batch})
+        title = f"{len(batch)} incidents: {summaries[0]}" + (f" (+{len(summaries) - 1} more)" if len(summaries) > 1 else "")
+    if len(title) > GITHUB_TITLE_MAX:
+        title = title[:GITHUB_TITLE_MAX - 1] + "…"
+    return await client.post(
+        f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/issues",
+        headers={"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"},
+        json={"title": title, "body": "\n\n".join(sections).strip(), "labels": ["incident"]},
+    )
+
+class NotificationDispatcher:
+    """
+    Delivers Slack and GitHub notifications off the incident path through one
+    shared HTTP client. Every destination has its own queue and a minimum
+    interval between sends; incidents that pile up while waiting for the next
+    slot are coalesced into a single digest. Throttled (429), failed (5xx)
+    and unreachable sends are retried with exponential backoff.
+    """
+
+    def __init__(self):
+        self._destinations = {}
+        self._queues = {}
+        self._tasks = []
+        self._client = None
+
+    def register(self, name: str, send, min_interval: float):
+        self._destinations[name] = (send, min_interval)
+        self._queues[name] = asyncio.Queue()
+
+    def submit(self, incident_id: str, alert: dict, ai_insight: dict):
+        for queue in self._queues.values():
+            queue.put_nowait({"incident_id": incident_id, "alert": alert, "ai_insight": ai_insight})
+
+    def start(self):
+        self._client = httpx.AsyncClient(timeout=30.0)
+        self._tasks = [asyncio.create_task(self._run(name)) for name in self._destinations]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def _run(self, name: str):
+        _, min_interval = self._destinations[name]
+        queue = self._queues[name]
+        last_sent = 0.0
+        while True:
+            batch = [await queue.get()]
+            wait = last_sent + min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            while len(batch) < NOTIFY_DIGEST_MAX and not queue.empty():
+                batch.append(queue.get_nowait())
+            await self._deliver(name, batch)
+            last_sent = time.monotonic()
+
+    async def _deliver(self, name: str, batch: list):
+        send, _ = self._destinations[name]
+        incident_ids = [item["incident_id"] for item in batch]
+        for attempt in range(1, NOTIFY_MAX_ATTEMPTS + 1):
+            delay = NOTIFY_BACKOFF_BASE * 2 ** (attempt - 1)
+            try:
+                with observe_stage(name):
+                    response = await send(self._client, batch)
+            except httpx.RequestError as e:
+                error = str(e)
+            else:
+                if response.status_code >= 300:
+                    FAILURES.labels(stage=name).inc()
+                if response.status_code < 300:
+                    print(f"--- {name} notification sent for {len(batch)} incident(s). ---")
+                    return
+                retry_after = response.headers.get("Retry-After", "")
+                if response.status_code != 429 and response.status_code < 500 and not retry_after:
+                    print(f"--- ERROR: {name} rejected the notification for {incident_ids}: HTTP {response.status_code} {response.text[:200]} ---")
+                    return
+                error = f"HTTP {response.status_code}"
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            if attempt < NOTIFY_MAX_ATTEMPTS:
+                print(f"--- {name} notification failed ({error}), retrying in {delay:.0f}s ---")
+                await asyncio.sleep(delay)
+        print(f"--- ERROR: Giving up on {name} notification for {incident_ids} after {NOTIFY_MAX_ATTEMPTS} attempts ---")
+
+notifier = NotificationDispatcher()
+if SLACK_WEBHOOK_URL:
+    notifier.register("slack", send_to_slack, SLACK_MIN_INTERVAL)
+if GITHUB_TOKEN and GITHUB_REPO:
+    notifier.register("github", send_to_github, GITHUB_MIN_INTERVAL)
+
+# --- Panel Artifacts ---
+ARTIFACT_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+class ArtifactStore:
+    """
+    Content-addressed files under ARTIFACT_DIR/<first 2 hex>/<sha256><suffix>.
+    Reads and writes refresh an artifact's position, and the least recently
+    used are deleted once the store exceeds max_bytes. The index is rebuilt
+    from the directory (by mtime) on startup. Disk I/O runs in a thread.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()  # sha256 -> (path, size), least recently used first
+        self._bytes = 0
+
+    def load(self):
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                digest = name.split(".", 1)[0]
+                if ARTIFACT_DIGEST.fullmatch(digest):
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, digest, path, stat.st_size))
+        for _, digest, path, size in sorted(files):
+            self._index[digest] = (path, size)
+        self._bytes = sum(size for _, size in self._index.values())
+        ARTIFACT_BYTES.set(self._bytes)
+        return len(self._index)
+
+    def path(self, digest: str):
+        entry = self._index.get(digest)
+        return entry[0] if entry else None
+
+    async def put(self, data: bytes, suffix: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.root, digest[:2], digest + suffix)
+        if digest in self._index:
+            if await asyncio.to_thread(self._touch, path):
+                self._refresh(digest)
+                return digest
+            # Deleted behind our back: forget it and write it again
+            self._forget(digest)
+        await asyncio.to_thread(self._write, path, data)
+        if digest in self._index:
+            # A concurrent put of the same content got there first
+            self._refresh(digest)
+            return digest
+        self._index[digest] = (path, len(data))
+        self._bytes += len(data)
+        await self._evict()
+        return digest
+
+    async def get(self, digest: str):
+        path = self.path(digest)
+        if path is None:
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, path)
+        except FileNotFoundError:
+            self._forget(digest)
+            return None
+        self._refresh(digest)
+        return data
+
+    # The index can change while disk I/O runs in a thread (_evict may drop the
+    # same digest), so these tolerate entries that are already gone.
+    def _refresh(self, digest: str):
+        if digest in self._index:
+            self._index.move_to_end(digest)
+
+    def _forget(self, digest: str):
+        entry = self._index.pop(digest, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+            ARTIFACT_BYTES.set(self._bytes)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a crash never leaves a truncated file under its hash
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        os.utime(path)
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _evict(self):
+        doomed = []
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            digest, (path, size) = self._index.popitem(last=False)
+            self._bytes -= size
+            doomed.append(path)
+        ARTIFACT_BYTES.set(self._bytes)
+        if doomed:
+            ARTIFACT_EVICTIONS.inc(len(doomed))
+            await asyncio.to_thread(lambda: [os.remove(path) for path in doomed if os.path.exists(path)])
+
+    def stats(self) -> dict:
+        return {"artifacts": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+artifact_store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_MAX_BYTES)
+render_slots = asyncio.Semaphore(RENDER_CONCURRENCY)
+# (dashboard, panel, time bucket) -> artifact hash of a recent render
+recent_renders = {}
+# (dashboard, panel, time bucket) -> task for the one render that concurrent captures share
+inflight_renders = {}
+
+async def render_grafana_panel(dashboard_uid: str, panel_id: int):
+    """Renders one panel through the renderer slots and stores it; returns its artifact hash, or None."""
     url = f"{GRAFANA_URL}/render/d-solo/{dashboard_uid}/?orgId=1&panelId={panel_id}&width=1000&height=500&tz=UTC"
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-        if response.status_code == 200:
-            print(f"--- Successfully captured Grafana panel {panel_id} ---")
-            return response.content
-    except httpx.RequestError as e:
-        print(f"--- ERROR: Failed to capture Grafana panel: {e} ---")
-    return None
+    queued = time.perf_counter()
+    async with render_slots:
+        RENDER_QUEUE_WAIT.observe(time.perf_counter() - queued)
+        try:
+            with observe_stage("grafana_render"):
+                async with httpx.AsyncClient(timeout=30.0) as client:
+                    response = await client.get(url)
+        except httpx.RequestError as e:
+            print(f"--- ERROR: Failed to capture Grafana panel: {e} ---")
+            return None
+    if response.status_code != 200:
+        FAILURES.labels(stage="grafana_render").inc()
+        return None
+    digest = await artifact_store.put(response.content, ".png")
+    print(f"--- Captured Grafana panel {panel_id} as artifact {digest[:12]} ---")
+    return digest
+
+async def capture_grafana_panel(dashboard_uid: str, panel_id: int):
+    """
+    Returns (png bytes, artifact hash, cache result) for a panel, or None.
+    Captures within the same RENDER_CACHE_TTL bucket reuse one render.
+    """
+    key = (dashboard_uid, panel_id, int(time.time() // RENDER_CACHE_TTL))
+    digest = recent_renders.get(key)
+    if digest is not None:
+        image_bytes = await artifact_store.get(digest)
+        if image_bytes is not None:
+            RENDER_REQUESTS.labels(result="hit").inc()
+            return image_bytes, digest, "hit"
+
+    task = inflight_renders.get(key)
+    result = "coalesced"
+    if task is None:
+        result = "miss"
+        # Its own task, so an alert whose stage times out cannot cancel the render for the others
+        task = inflight_renders[key] = asyncio.create_task(render_grafana_panel(dashboard_uid, panel_id))
+        task.add_done_callback(lambda done: store_render(key, done))
+    RENDER_REQUESTS.labels(result=result).inc()
+    digest = await asyncio.shield(task)
+    image_bytes = digest and await artifact_store.get(digest)
+    return (image_bytes, digest, result) if image_bytes else None
+
+def store_render(key: tuple, task: asyncio.Task):
+    inflight_renders.pop(key, None)
+    if not task.cancelled() and task.exception() is None and task.result():
+        # Older buckets can no longer be hit
+        for stale in [k for k in recent_renders if k[2] < key[2]]:
+            del recent_renders[stale]
+        recent_renders[key] = task.result()
 
 def parse_ocr_text(text: str) -> dict:
     """Uses regex to find meaningful numbers in the OCR output."""
@@ -116,90 +1042,663 @@ def parse_ocr_text(text: str) -> dict:
         return {"metric": "p95_latency", "value": value_ms, "unit": "ms"}
     return {"raw_text": text}
 
-@app.post("/webhook/alert")
-async def receive_alert(request: Request):
-    alert_payload = await request.json()
-    print(f"--- Received Alert Payload ---")
-    incident_id = str(uuid.uuid4())
-
-    alert = alert_payload.get('alerts', [{}])[0]
-    add_timeline_event(incident_id, "alert", alert)
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
 
-    # --- AI Enrichment Workflow ---
-    alert_name = alert.get('labels', {}).get('alertname', '')
+async def run_stage(incident_id: str, stage: str, coro):
+    """
+    Runs one enrichment stage under its own deadline. On timeout the stage is
+    cancelled and a 'stage_timeout' event is recorded instead of its insight.
+    """
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(coro, timeout=STAGE_TIMEOUTS[stage])
+    except asyncio.TimeoutError:
+        FAILURES.labels(stage=stage).inc()
+        print(f"--- Stage '{stage}' exceeded its {STAGE_TIMEOUTS[stage]}s deadline for incident {incident_id} ---")
+        add_timeline_event(incident_id, "stage_timeout", {"stage": stage, "timeout_s": STAGE_TIMEOUTS[stage], "duration_ms": elapsed_ms(started)})
+    except Exception as e:
+        print(f"--- ERROR: Stage '{stage}' failed for incident {incident_id}: {e} ---")
+        add_timeline_event(incident_id, "stage_error", {"stage": stage, "error": str(e), "duration_ms": elapsed_ms(started)})
+    return None
 
-    # Default action for any alert: query DocQA
+async def docqa_stage(incident_id: str, alert_name: str) -> dict:
+    started = time.perf_counter()
     question = f"What is the runbook for the {alert_name} alert?"
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(f"{AI_GATEWAY_URL}/route/docqa", json={"query": question})
+    with observe_stage("docqa"):
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            response = await client.post(f"{AI_GATEWAY_URL}/route/docqa", json={"query": question}, headers=GATEWAY_HEADERS)
 
+    if response.status_code != 200:
+        FAILURES.labels(stage="docqa").inc()
     qa_result = response.json() if response.status_code == 200 else {}
-    add_timeline_event(incident_id, "ai_insight_docqa", qa_result)
+    add_timeline_event(incident_id, "ai_insight_docqa", {**qa_result, "duration_ms": elapsed_ms(started)})
+    return qa_result
+
+async def vision_stage(incident_id: str):
+    started = time.perf_counter()
+    captured = await capture_grafana_panel(dashboard_uid="toyprod-main", panel_id=4) # PANEL ID 4 IS THE NEW STAT PANEL
+    if not captured:
+        return
+    image_bytes, digest, render_result = captured
+    artifact = {"sha256": digest, "url": f"/artifacts/{digest}", "bytes": len(image_bytes), "render": render_result}
+    with observe_stage("ocr"):
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            files = {'image_file': ('panel.png', image_bytes, 'image/png')}
+            response = await client.post(f"{AI_GATEWAY_URL}/route/vision", files=files, headers=GATEWAY_HEADERS)
+    if response.status_code != 200:
+        FAILURES.labels(stage="ocr").inc()
+        # Keep the panel on the timeline even when OCR fails
+        add_timeline_event(incident_id, "grafana_panel", {"artifact": artifact, "duration_ms": elapsed_ms(started)})
+    else:
+        vision_result = response.json()
+        # Parse the text to make it meaningful
+        parsed_vision_result = parse_ocr_text(vision_result.get("text", ""))
+        add_timeline_event(incident_id, "ai_insight_vision", {**parsed_vision_result, "artifact": artifact, "duration_ms": elapsed_ms(started)})
 
-    # Send a basic notification right away
-    post_to_slack(incident_id, alert, qa_result)
-    create_github_issue(incident_id, alert, qa_result)
+async def forecast_stage(incident_id: str):
+    started = time.perf_counter()
+    # Aligned to the 60s step so every alert within the same minute sends the
+    # forecaster the same history, which it can answer from its cache
+    end_time = int(time.time()) // 60 * 60
+    start_time = end_time - FORECAST_HISTORY_SECONDS
+    history_values = series_store.history(FORECAST_QUERY, end_time, FORECAST_HISTORY_SECONDS)
+    if history_values is not None:
+        HISTORY_SOURCE.labels(source="series_store").inc()
+    else:
+        # The store has not (yet) seen enough of this window: ask Prometheus directly
+        prom_url = f"{PROMETHEUS_URL}/api/v1/query_range?query={FORECAST_QUERY}&start={start_time}&end={end_time}&step=60s"
+        with observe_stage("prometheus_query"):
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                prom_response = await client.get(prom_url)
+        if prom_response.status_code != 200:
+            FAILURES.labels(stage="prometheus_query").inc()
+            return
+        results = prom_response.json()['data']['result']
+        if not results:
+            return
+        if len(results) > 1:
+            raise ValueError(f"{len(results)} series of {FORECAST_QUERY} returned; narrow the query")
+        HISTORY_SOURCE.labels(source="query_range").inc()
+        history_values = np.array(results[0]['values'], dtype=np.float64)[:, 1].tolist()
+    with observe_stage("forecast"):
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            response = await client.post(f"{AI_GATEWAY_URL}/route/forecaster", json={"history": history_values, "threshold": LATENCY_SLO}, headers=GATEWAY_HEADERS)
+    if response.status_code != 200:
+        FAILURES.labels(stage="forecast").inc()
+        return
+    forecast_result = response.json()
+    add_timeline_event(incident_id, "ai_insight_forecast", {**forecast_result, "duration_ms": elapsed_ms(started)})
+
+    # Analyze the forecast for proactive warning
+    proactive_warning = ""
+    for i, val in enumerate(forecast_result.get("forecast", [])[0]):
+        if val > LATENCY_SLO:
+            proactive_warning = f"AI predicts latency will breach the {LATENCY_SLO}s SLO in approximately {i+1} minute(s)."
+            break
+    if proactive_warning:
+        add_timeline_event(incident_id, "ai_proactive_warning", {"warning": proactive_warning})
+        # You could send a follow-up Slack message here too
+
+# Timeline events that show an enrichment stage already ran for an incident
+STAGE_EVENTS = {
+    "alert": {"alert"},
+    "docqa": {"ai_insight_docqa"},
+    "vision": {"ai_insight_vision", "grafana_panel"},
+    "forecast": {"ai_insight_forecast"},
+}
+
+async def completed_stages(incident_id: str) -> set:
+    """Stages with an event on the incident's timeline, including ones that timed out or failed."""
+    await timeline_writer.flush()
+    stmt = select(timeline_table.c.type, timeline_table.c.payload).where(timeline_table.c.incident_id == incident_id)
+    async with engine.connect() as connection:
+        rows = (await connection.execute(stmt)).fetchall()
+    done = set()
+    for row in rows:
+        if row.type in ("stage_timeout", "stage_error"):
+            done.add(row.payload.get("stage"))
+        done.update(stage for stage, types in STAGE_EVENTS.items() if row.type in types)
+    return done
+
+async def process_alert(incident_id: str, alert: dict, done: set = frozenset()):
+    """Runs every enrichment stage not in done, so a retried job does not repeat events or notifications."""
+    if "alert" not in done:
+        add_timeline_event(incident_id, "alert", alert)
+
+    # --- AI Enrichment Workflow ---
+    alert_name = alert.get('labels', {}).get('alertname', '')
+
+    async def docqa_and_notify():
+        # Default action for any alert: query DocQA, then notify with whatever it found
+        qa_result = await run_stage(incident_id, "docqa", docqa_stage(incident_id, alert_name)) or {}
+        notifier.submit(incident_id, alert, qa_result)
+
+    # The notification is submitted as soon as the DocQA stage ends, so a recorded DocQA stage means it went out
+    stages = [docqa_and_notify()] if "docqa" not in done else []
 
     # Specific actions for different alerts
     if alert_name == 'ToyProdHighLatency':
         print("--- High latency alert detected, triggering Vision and Forecasting workflows ---")
+        if "vision" not in done:
+            stages.append(run_stage(incident_id, "vision", vision_stage(incident_id)))
+        if "forecast" not in done:
+            stages.append(run_stage(incident_id, "forecast", forecast_stage(incident_id)))
+
+    await asyncio.gather(*stages)
+
+    # The incident only counts as processed once its whole timeline is durable.
+    await timeline_writer.flush()
+
+async def process_job(kind: str, incident_id: str, alert: dict, attempts: int = 1):
+    if kind == "new":
+        done = await completed_stages(incident_id) if attempts > 1 else set()
+        if done:
+            print(f"--- Retrying incident {incident_id}, skipping stages already on its timeline: {sorted(done)} ---")
+        await process_alert(incident_id, alert, done)
+        return
+
+    # Repeats and resolutions of an open incident only get a lightweight marker, no AI enrichment.
+    details = {
+        "fingerprint": alert_fingerprint(alert),
+        "startsAt": alert.get("startsAt"),
+        "endsAt": alert.get("endsAt"),
+    }
+    add_timeline_event(incident_id, "alert_still_firing" if kind == "repeat" else "alert_resolved", details)
+    await timeline_writer.flush()
+
+# --- Incident Correlation ---
+def alert_fingerprint(alert: dict) -> str:
+    """Alertmanager's own fingerprint, or a stable hash of the label set when it is missing."""
+    if alert.get("fingerprint"):
+        return alert["fingerprint"]
+    labels = json.dumps(alert.get("labels", {}), sort_keys=True)
+    return hashlib.sha256(labels.encode("utf-8")).hexdigest()[:16]
+
+class OpenIncidents:
+    """
+    In-memory fingerprint -> open incident index, backed by the incidents
+    table so it survives restarts. Only open incidents are kept in memory.
+    """
+
+    def __init__(self, max_idle_seconds: float):
+        self.max_idle_seconds = max_idle_seconds
+        self._by_fingerprint = {}
+        self.loaded = False
+        # Serialises correlation decisions across concurrent webhook deliveries.
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._by_fingerprint)
+
+    async def load(self):
+        stmt = select(incidents_table.c.fingerprint, incidents_table.c.incident_id, incidents_table.c.last_seen_at).where(
+            incidents_table.c.status == "open"
+        )
+        async with engine.connect() as connection:
+            rows = (await connection.execute(stmt)).fetchall()
+        self._by_fingerprint = {row.fingerprint: (row.incident_id, row.last_seen_at.timestamp()) for row in rows}
+        self.loaded = True
+
+    def lookup(self, fingerprint: str, now: float):
+        """Returns (incident_id, expired) for the open incident of this fingerprint, or (None, False)."""
+        entry = self._by_fingerprint.get(fingerprint)
+        if entry is None:
+            return None, False
+        incident_id, last_seen = entry
+        return incident_id, now - last_seen > self.max_idle_seconds
+
+    def apply(self, changes: dict, now: float):
+        for fingerprint, incident_id in changes.items():
+            if incident_id is None:
+                self._by_fingerprint.pop(fingerprint, None)
+            else:
+                self._by_fingerprint[fingerprint] = (incident_id, now)
+
+open_incidents = OpenIncidents(INCIDENT_MAX_IDLE_SECONDS)
+
+# --- Alert Job Queue ---
+CLAIM_JOB_SQL = text("""
+    UPDATE alert_jobs
+    SET status = 'running', attempts = attempts + 1, updated_at = NOW()
+    WHERE id = (
+        SELECT id FROM alert_jobs
+        WHERE status = 'queued'
+           OR (status = 'running' AND updated_at < NOW() - make_interval(secs => :lease_seconds))
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id, kind, incident_id, alert, attempts
+""")
+
+async def enqueue_alert_jobs(alerts: list) -> list:
+    """
+    Correlates each alert with the open incident of its fingerprint and
+    persists one job per alert in a single transaction. A firing alert with
+    no open incident opens one ('new'), a repeat is folded into it
+    ('repeat'), and a resolved alert closes it ('resolve'). Returns the
+    incident ID of every queued job.
+    """
+    async with open_incidents.lock:
+        # Correlating against an empty index would open duplicates of incidents that are
+        # already open (and trip incidents_open_fingerprint_idx), so a load that failed at
+        # startup is retried here; if it fails again the webhook errors and Alertmanager retries.
+        if not open_incidents.loaded:
+            await open_incidents.load()
+            print(f"--- Loaded {len(open_incidents)} open incident(s) into the fingerprint index ---")
+        now = time.time()
+        now_ts = datetime.fromtimestamp(now, timezone.utc)
+        changes = {}
+        jobs, opened, seen, resolved, expired = [], [], [], [], []
+
+        for alert in alerts:
+            fingerprint = alert_fingerprint(alert)
+            if fingerprint in changes:
+                incident_id, is_expired = changes[fingerprint], False
+            else:
+                incident_id, is_expired = open_incidents.lookup(fingerprint, now)
+            if is_expired:
+                expired.append(incident_id)
+                incident_id = None
+
+            if alert.get("status") == "resolved":
+                if incident_id is None:
+                    print(f"--- Ignoring resolved alert {fingerprint}: no open incident ---")
+                    changes[fingerprint] = None
+                    continue
+                kind = "resolve"
+                resolved.append(incident_id)
+                changes[fingerprint] = None
+            elif incident_id is None:
+                kind = "new"
+                incident_id = str(uuid.uuid4())
+                opened.append({
+                    "incident_id": incident_id,
+                    "fingerprint": fingerprint,
+                    "alertname": alert.get("labels", {}).get("alertname"),
+                    "status": "open",
+                    "opened_at": now_ts,
+                    "last_seen_at": now_ts,
+                })
+                changes[fingerprint] = incident_id
+            else:
+                kind = "repeat"
+                seen.append(incident_id)
+                changes[fingerprint] = incident_id
+
+            jobs.append({"kind": kind, "incident_id": incident_id, "alert": alert})
+
+        async with engine.begin() as connection:
+            if expired:
+                await connection.execute(
+                    update(incidents_table).where(incidents_table.c.incident_id.in_(expired)).values(status="expired")
+                )
+            if opened:
+                await connection.execute(insert(incidents_table).values(opened))
+            if seen:
+                await connection.execute(
+                    update(incidents_table).where(incidents_table.c.incident_id.in_(seen)).values(last_seen_at=now_ts)
+                )
+            if resolved:
+                await connection.execute(
+                    update(incidents_table)
+                    .where(incidents_table.c.incident_id.in_(resolved))
+                    .values(status="resolved", last_seen_at=now_ts, resolved_at=now_ts)
+                )
+            if jobs:
+                await connection.execute(insert(alert_jobs_table).values(jobs))
+
+        # Only mirror the decisions in memory once they are committed.
+        open_incidents.apply(changes, now)
+
+    kinds = [job["kind"] for job in jobs]
+    print(f"--- Queued {kinds.count('new')} new, {kinds.count('repeat')} repeat and {kinds.count('resolve')} resolve job(s) ---")
+    return [job["incident_id"] for job in jobs]
+
+async def claim_next_job():
+    async with engine.begin() as connection:
+        return (await connection.execute(CLAIM_JOB_SQL, {"lease_seconds": ALERT_JOB_LEASE_SECONDS})).first()
+
+async def renew_job_lease(job_id: int):
+    """Keeps a long-running job's lease fresh so no other worker reclaims it."""
+    while True:
+        await asyncio.sleep(ALERT_JOB_LEASE_SECONDS / 3)
+        try:
+            async with engine.begin() as connection:
+                await connection.execute(
+                    update(alert_jobs_table)
+                    .where(and_(alert_jobs_table.c.id == job_id, alert_jobs_table.c.status == "running"))
+                    .values(updated_at=func.now())
+                )
+        except Exception as e:
+            print(f"--- WARNING: Could not renew the lease of job {job_id}: {e} ---")
+
+async def complete_job(job_id: int):
+    async with engine.begin() as connection:
+        await connection.execute(delete(alert_jobs_table).where(alert_jobs_table.c.id == job_id))
+
+async def fail_job(job_id: int, attempts: int, error: str):
+    # Retry until the attempt budget is spent, then park the job as 'failed' for inspection.
+    status = "queued" if attempts < ALERT_JOB_MAX_ATTEMPTS else "failed"
+    async with engine.begin() as connection:
+        await connection.execute(
+            update(alert_jobs_table)
+            .where(alert_jobs_table.c.id == job_id)
+            .values(status=status, last_error=error, updated_at=func.now())
+        )
+
+async def requeue_interrupted_jobs() -> int:
+    # A single orchestrator owns the queue, so anything still 'running' at boot was cut off by a restart.
+    async with engine.begin() as connection:
+        result = await connection.execute(
+            update(alert_jobs_table)
+            .where(alert_jobs_table.c.status == "running")
+            .values(status="queued", updated_at=func.now())
+        )
+        return result.rowcount
+
+async def job_queue_stats() -> dict:
+    stmt = text("""
+        SELECT status, COUNT(*) AS jobs, EXTRACT(EPOCH FROM NOW() - MIN(created_at)) AS oldest_age_seconds
+        FROM alert_jobs
+        GROUP BY status
+    """)
+    async with engine.connect() as connection:
+        rows = (await connection.execute(stmt)).fetchall()
+    stats = {status: {"jobs": 0, "oldest_age_seconds": 0.0} for status in ("queued", "running", "failed")}
+    for row in rows:
+        stats[row.status] = {"jobs": row.jobs, "oldest_age_seconds": float(row.oldest_age_seconds or 0.0)}
+    return stats
+
+async def alert_job_worker(worker_id: int):
+    while True:
+        # Clear before claiming so a wake-up that arrives mid-claim is not lost.
+        job_wakeup.clear()
+        try:
+            job = await claim_next_job()
+        except Exception as e:
+            print(f"--- ERROR: Worker {worker_id} could not claim a job: {e} ---")
+            await asyncio.sleep(ALERT_JOB_POLL_INTERVAL)
+            continue
+
+        if job is None:
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), timeout=ALERT_JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        print(f"--- Worker {worker_id} processing {job.kind} job {job.id} (incident {job.incident_id}, attempt {job.attempts}) ---")
+        ALERTS_IN_FLIGHT.inc()
+        lease = asyncio.create_task(renew_job_lease(job.id))
+        try:
+            if job.attempts > ALERT_JOB_MAX_ATTEMPTS:
+                # Reclaimed after its lease ran out with no attempts left
+                raise RuntimeError(f"lease expired {job.attempts - 1} time(s)")
+            await process_job(job.kind, job.incident_id, job.alert, job.attempts)
+        except Exception as e:
+            FAILURES.labels(stage="job").inc()
+            print(f"--- ERROR: Job {job.id} failed on attempt {job.attempts}: {e} ---")
+            outcome = fail_job(job.id, job.attempts, str(e))
+        else:
+            INCIDENTS.labels(kind=job.kind).inc()
+            outcome = complete_job(job.id)
+        finally:
+            lease.cancel()
+            ALERTS_IN_FLIGHT.dec()
+
+        # A database error here must not end the worker; nothing restarts it.
+        try:
+            await outcome
+        except Exception as e:
+            print(f"--- ERROR: Worker {worker_id} could not record the outcome of job {job.id}: {e} ---")
+            await asyncio.sleep(ALERT_JOB_POLL_INTERVAL)
+
+# --- Proactive Forecast Scan ---
+def predicted_alert(metric: str, labels: dict, status: str, detail: dict = None) -> dict:
+    """
+    A synthetic Alertmanager-style alert for a predicted breach. Its labels
+    (and so its fingerprint) depend only on the series, so later scans fold
+    into the same incident and a scan that no longer predicts it resolves it.
+    """
+    alert_labels = {**{k: v for k, v in labels.items() if k != "__name__"}, "alertname": "PredictedSLOBreach", "metric": metric, "severity": "ticket"}
+    alert = {"status": status, "labels": alert_labels, "startsAt": datetime.now(timezone.utc).isoformat()}
+    if detail:
+        alert["annotations"] = {
+            "summary": f"Forecast: {metric} will exceed {detail['threshold']} in ~{detail['minutes_to_breach']} minute(s)",
+            "description": f"Predicted peak {detail['predicted_peak']:.4g} (forecast tier: {detail['tier']}).",
+        }
+        alert["forecast"] = detail
+    return alert
+
+async def forecast_scan_series(client: httpx.AsyncClient, end: int) -> list:
+    """All series of every FORECAST_SCAN_THRESHOLDS metric over the last hour, from one query_range."""
+    selector = "{__name__=~\"" + "|".join(re.escape(name) for name in FORECAST_SCAN_THRESHOLDS) + "\"}"
+    with observe_stage("scan_query"):
+        response = await client.get(
+            f"{PROMETHEUS_URL}/api/v1/query_range",
+            params={"query": selector, "start": end - FORECAST_HISTORY_SECONDS, "end": end, "step": "60s"},
+        )
+        response.raise_for_status()
+    series = []
+    for result in response.json()["data"]["result"]:
+        metric = result["metric"].get("__name__")
+        if metric not in FORECAST_SCAN_THRESHOLDS or not result["values"]:
+            continue
+        values = np.array(result["values"], dtype=np.float64)[:, 1]
+        series.append({"metric": metric, "labels": result["metric"], "history": values[~np.isnan(values)].tolist()})
+    return [entry for entry in series if entry["history"]]
+
+async def run_forecast_scan() -> dict:
+    """
+    One scan: fetch, forecast in FORECAST_SCAN_BATCH-sized forecaster calls,
+    then open (or keep open) a predicted incident for every breach and
+    resolve the predicted incidents of series no longer heading for one.
+    """
+    started = time.perf_counter()
+    end = int(time.time()) // 60 * 60
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        series = await forecast_scan_series(client, end)
+        batches = [series[i:i + FORECAST_SCAN_BATCH] for i in range(0, len(series), FORECAST_SCAN_BATCH)]
+
+        async def forecast_batch(batch: list) -> list:
+            payload = {
+                "series": [
+                    {"name": str(i), "history": entry["history"], "threshold": FORECAST_SCAN_THRESHOLDS[entry["metric"]]}
+                    for i, entry in enumerate(batch)
+                ],
+                "prediction_length": FORECAST_SCAN_HORIZON,
+                "quantile_levels": [0.5],
+            }
+            response = await client.post(f"{AI_GATEWAY_URL}/route/forecaster_batch", json=payload, headers={"X-Priority": "batch"})
+            response.raise_for_status()
+            return response.json()["forecasts"]
+
+        with observe_stage("scan_forecast"):
+            forecasts = [forecast for result in await asyncio.gather(*(forecast_batch(batch) for batch in batches)) for forecast in result]
+
+    alerts, breaches = [], 0
+    now = time.time()
+    for entry, forecast in zip(series, forecasts):
+        threshold = FORECAST_SCAN_THRESHOLDS[entry["metric"]]
+        mean = np.asarray(forecast["mean"])
+        over = np.flatnonzero(mean > threshold)
+        if len(over):
+            breaches += 1
+            PREDICTED_BREACHES.labels(metric=entry["metric"]).inc()
+            detail = {
+                "threshold": threshold,
+                "minutes_to_breach": int(over[0]) + 1,
+                "predicted_peak": float(mean.max()),
+                "tier": forecast.get("tier"),
+                "forecast": forecast["mean"],
+            }
+            alerts.append(predicted_alert(entry["metric"], entry["labels"], "firing", detail))
+        else:
+            alert = predicted_alert(entry["metric"], entry["labels"], "resolved")
+            if open_incidents.lookup(alert_fingerprint(alert), now)[0] is not None:
+                alerts.append(alert)
+    if alerts:
+        await enqueue_alert_jobs(alerts)
+        job_wakeup.set()
+
+    elapsed = time.perf_counter() - started
+    SCAN_DURATION.observe(elapsed)
+    SCAN_SERIES.set(len(series))
+    summary = {
+        "series": len(series),
+        "forecaster_calls": len(batches),
+        "predicted_breaches": breaches,
+        "resolved": sum(alert["status"] == "resolved" for alert in alerts),
+        "duration_ms": round(elapsed * 1000, 1),
+    }
+    print(f"--- Forecast scan: {summary} ---")
+    return summary
+
+async def forecast_scan_loop():
+    while True:
+        await asyncio.sleep(FORECAST_SCAN_INTERVAL)
+        try:
+            await run_forecast_scan()
+        except Exception as e:
+            FAILURES.labels(stage="forecast_scan").inc()
+            print(f"--- ERROR: Forecast scan failed: {e} ---")
+
+@app.post("/webhook/alert", status_code=202)
+async def receive_alert(request: Request):
+    """
+    Persists every alert in the Alertmanager notification as a job and
+    acknowledges right away; enrichment happens in the job workers.
+    """
+    alert_payload = await request.json()
+    alerts = alert_payload.get('alerts', [])
+    print(f"--- Received Alert Payload with {len(alerts)} alert(s) ---")
+
+    incident_ids = await enqueue_alert_jobs(alerts) if alerts else []
+    job_wakeup.set()
+    return {"status": "accepted", "incident_ids": incident_ids}
+
+@app.post("/api/v1/write", status_code=204)
+async def receive_remote_write(request: Request):
+    """Prometheus remote-write receiver; samples of SERIES_STORE_METRICS go into the series store."""
+    try:
+        for labels, timestamps, values in decode_write_request(await request.body()):
+            series_store.add(labels, timestamps, values)
+    except (cramjam.DecompressionError, ValueError, IndexError, struct.error) as e:
+        return Response(f"invalid remote-write request: {e}", status_code=400)
+    return Response(status_code=204)
+
+@app.post("/forecast/scan")
+async def trigger_forecast_scan():
+    """Runs a proactive forecast scan now, outside the schedule."""
+    return await run_forecast_scan()
+
+@app.get("/artifacts/stats")
+async def get_artifact_stats():
+    return artifact_store.stats()
+
+@app.get("/artifacts/{digest}")
+async def get_artifact(digest: str):
+    path = artifact_store.path(digest) if ARTIFACT_DIGEST.fullmatch(digest) else None
+    if path is None or not os.path.exists(path):
+        return Response(status_code=404)
+    # Content-addressed, so the response never changes
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/series/stats")
+async def get_series_stats():
+    return series_store.stats()
+
+@app.get("/jobs/stats")
+async def get_job_stats():
+    return await job_queue_stats()
 
-        # Vision Workflow
-        image_bytes = await capture_grafana_panel(dashboard_uid="toyprod-main", panel_id=4) # PANEL ID 4 IS THE NEW STAT PANEL
-        if image_bytes:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                files = {'image_file': ('panel.png', image_bytes, 'image/png')}
-                response = await client.post(f"{AI_GATEWAY_URL}/route/vision", files=files)
-            if response.status_code == 200:
-                vision_result = response.json()
-                # NEW: Parse the text to make it meaningful
-                parsed_vision_result = parse_ocr_text(vision_result.get("text", ""))
-                add_timeline_event(incident_id, "ai_insight_vision", parsed_vision_result)
-
-        # Forecasting Workflow
-        end_time = int(time.time())
-        start_time = end_time - (60 * 60) # 1 hour of history
-        prom_query = f'toyprod:p95_latency_seconds:5m'
-        prom_url = f"{PROMETHEUS_URL}/api/v1/query_range?query={prom_query}&start={start_time}&end={end_time}&step=60s"
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            prom_response = await client.get(prom_url)
-        if prom_response.status_code == 200:
-            results = prom_response.json()['data']['result']
-            if results:
-                history_values = [float(val[1]) for val in results[0]['values']]
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.post(f"{AI_GATEWAY_URL}/route/forecaster", json={"history": history_values})
-                if response.status_code == 200:
-                    forecast_result = response.json()
-                    add_timeline_event(incident_id, "ai_insight_forecast", forecast_result)
-
-                    # NEW: Analyze the forecast for proactive warning
-                    proactive_warning = ""
-                    for i, val in enumerate(forecast_result.get("forecast", [])[0]):
-                        if val > LATENCY_SLO:
-                            proactive_warning = f"AI predicts latency will breach the {LATENCY_SLO}s SLO in approximately {i+1} minute(s)."
-                            break
-                    if proactive_warning:
-                        add_timeline_event(incident_id, "ai_proactive_warning", {"warning": proactive_warning})
-                        # You could send a follow-up Slack message here too
-
-    return {"status": "ok", "incident_id": incident_id}
-
-# (get_timeline and healthz endpoints remain the same)
 @app.get("/timeline/{incident_id}")
-def get_timeline(incident_id: str):
-    # ... code is unchanged ...
-    with engine.connect() as connection:
-        stmt = select(timeline_table).where(timeline_table.c.incident_id == incident_id).order_by(timeline_table.c.event_ts)
-        results = connection.execute(stmt).fetchall()
-        return [dict(row._mapping) for row in results]
+async def get_timeline(incident_id: str, request: Request, response: Response, since: int = 0):
+    """
+    Returns the incident's events with an ID greater than `since` (all events
+    by default). The ETag is the newest event ID, so a client that already has
+    it gets a 304 without the database being touched.
+    """
+    version = timeline_versions.get(incident_id)
+    if version is not None and request.headers.get("if-none-match") == f'"{version}"':
+        return Response(status_code=304, headers={"ETag": f'"{version}"'})
+
+    async with engine.connect() as connection:
+        if version is None:
+            # Read the version before the events: a flush committed in between then only
+            # makes the ETag older than the events (a refetch), never newer (a missed event)
+            max_id_stmt = select(func.max(timeline_table.c.id)).where(timeline_table.c.incident_id == incident_id)
+            version = (await connection.execute(max_id_stmt)).scalar() or 0
+            timeline_versions.advance(incident_id, version)
+        events = await fetch_timeline_events(connection, incident_id, since)
+
+    response.headers["ETag"] = f'"{version}"'
+    return events
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+
+@app.get("/timeline/{incident_id}/stream")
+async def stream_timeline(incident_id: str, request: Request, since: int = 0):
+    """
+    Server-Sent Events stream of the incident's timeline: the existing events
+    first, then each new event as it is committed. Reconnecting browsers send
+    Last-Event-ID and resume where they left off.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+
+    # Subscribe before reading the backlog so nothing committed in between is missed.
+    queue = timeline_hub.subscribe(incident_id)
+
+    async def event_stream():
+        cursor = since
+        try:
+            async with engine.connect() as connection:
+                backlog = await fetch_timeline_events(connection, incident_id, cursor)
+            for event in backlog:
+                cursor = event["id"]
+                yield format_sse(event)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                if event["id"] > cursor:
+                    cursor = event["id"]
+                    yield format_sse(event)
+        finally:
+            timeline_hub.unsubscribe(incident_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+async def metrics():
+    # Queue gauges are read from Postgres at scrape time so they also cover jobs from before a restart.
+    try:
+        for status, stats in (await job_queue_stats()).items():
+            JOB_QUEUE_DEPTH.labels(status=status).set(stats["jobs"])
+            JOB_OLDEST_AGE.labels(status=status).set(stats["oldest_age_seconds"])
+    except Exception as e:
+        print(f"--- ERROR: Could not read job queue stats for /metrics: {e} ---")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/healthz")
-def healthz():
-    # ... code is unchanged ...
+async def healthz():
     try:
-        with engine.connect() as connection:
-            connection.execute(text("SELECT 1"))
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
         return {"status": "ok", "database": "connected"}
     except Exception:
-        return {"status": "error", "database": "disconnected"}
\ No newline at end of file
+        return {"status": "error", "database": "disconnected"}
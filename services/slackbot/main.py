@@ -27,6 +27,7 @@ def handle_app_mention_events(body, say):
         response = httpx.post(
             f"{AI_GATEWAY_URL}/route/docqa",
             json={"query": user_query},
+            headers={"X-Priority": "interactive"},
             timeout=60.0
         )
 